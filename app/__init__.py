@@ -2,8 +2,16 @@
 Multi-tool Agent using Google ADK.
 """
 
-# Import root agent from the local agent.py file
-from .agent import root_agent
 
-# This is required for ADK web UI to find the agent
-agent = root_agent 
\ No newline at end of file
+def __getattr__(name):
+    # Resolve the root agent on first access so that importing lightweight
+    # submodules (app.agent_analytics, app.log_api, ...) does not pull in ADK
+    # and every tool module.
+    if name in ("root_agent", "agent"):
+        from .agent import root_agent
+
+        # This is required for ADK web UI to find the agent
+        globals()["root_agent"] = root_agent
+        globals()["agent"] = root_agent
+        return root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
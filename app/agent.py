@@ -3,31 +3,47 @@ Simple MMVN Root Agent (single-agent) aligned with DDV structure.
 Capabilities: search, explore detail, compare, memory.
 """
 
+import asyncio
+import atexit
+import functools
+import hashlib
+import importlib.util
 import logging
 import os
-import json
+import queue
+import random
+import sys
+import threading
 import time
-from typing import Dict, Any, Optional
-from google.adk.agents import Agent
-from google.adk.tools import FunctionTool, load_memory
-from google.adk.memory import InMemoryMemoryService
+from logging.handlers import QueueHandler, QueueListener
+from typing import TYPE_CHECKING, Dict, Any, Optional, Tuple
+
+from app.shared_libraries import json_utils
+
+if TYPE_CHECKING:
+    from google import genai
+    from google.adk.agents import Agent
+    from google.genai import types
 
 # Keep using existing constants if available; fallback to flash model name
-try:
-    from app.shared_libraries.constants import MODEL_GEMINI_2_5_FLASH_LITE as PRIMARY_MODEL
-except Exception:
-    PRIMARY_MODEL = "gemini-2.5-flash-lite"
+_DEFAULT_MODEL = "gemini-2.5-flash-lite"
+if importlib.util.find_spec("app.shared_libraries.constants") is not None:
+    from app.shared_libraries import constants as _constants
+    PRIMARY_MODEL = getattr(_constants, "MODEL_GEMINI_2_5_FLASH_LITE", _DEFAULT_MODEL)
+else:
+    PRIMARY_MODEL = _DEFAULT_MODEL
 
-# Optimized instruction for faster responses
-MMVN_AGENT_INSTRUCTION = """Bạn là Trợ lý mua sắm MMVN. Luôn dùng công cụ để:
+# Optimized instruction for faster responses (interned: one shared copy per process)
+MMVN_AGENT_INSTRUCTION = sys.intern("""Bạn là Trợ lý mua sắm MMVN. Luôn dùng công cụ để:
 - Tìm kiếm sản phẩm (search_products) - trả về 10 sản phẩm
 - Xem chi tiết (explore_product)
 - So sánh (compare_products)
 - Truy vấn thông tin từ cuộc trò chuyện trước (load_memory) khi cần thiết
 - Lưu thông tin quan trọng (memorize, memorize_list)
 - Lưu lịch sử tìm kiếm (store_search_memory)
-- Phản hồi bằng ngôn ngữ của câu hỏi, search luôn bằng tiếng Việt 
+- Phản hồi bằng ngôn ngữ của câu hỏi, search luôn bằng tiếng Việt
 - Gọi công cụ và phản hồi JSON product-display từ công cụ để frontend hiển thị.
+- Các lệnh gọi công cụ độc lập với nhau (nhiều search_products cho từng keyword, memorize, memorize_list) phải được gọi song song trong CÙNG MỘT lượt, không gọi tuần tự từng cái một.
 
 Khi người dùng hỏi về sản phẩm đã thảo luận trước đó hoặc cần thông tin từ cuộc trò chuyện trước, hãy sử dụng load_memory để tìm kiếm thông tin liên quan.
 
@@ -94,25 +110,56 @@ Khi người dùng yêu cầu tìm kiếm mà không cung cấp bộ lọc hay s
 - Dùng search_products với filters để trống (tìm toàn bộ) và page=1 cho lần đầu.
 - Nếu người dùng yêu cầu xem thêm, giữ nguyên keywords/filters trước đó và tăng page lên 2, 3,...
 - Không hỏi lại người dùng về filter hay page nếu có thể suy luận từ ngữ cảnh.
-"""
-
-# Import tools
-from app.tools.search import search_products
-from app.tools.explore import explore_product
-from app.tools.compare import compare_products
-from app.tools.memory_tools import memorize, memorize_list, get_memory, store_search_memory
+""")
 
 logger = logging.getLogger(__name__)
 
+class _BatchingFileHandler(logging.FileHandler):
+    """FileHandler that flushes once per burst of records instead of after every record.
+
+    Runs on the QueueListener thread: while more records are waiting in the log queue
+    they only go into the file buffer, so a burst costs a few write() syscalls rather
+    than one per line. The buffer is flushed as soon as the queue is drained.
+    """
+
+    def __init__(self, filename: str, log_queue: "queue.Queue[logging.LogRecord]", **kwargs):
+        super().__init__(filename, **kwargs)
+        self._log_queue = log_queue
+
+    def flush(self) -> None:
+        # StreamHandler.emit calls flush() after each record
+        if self._log_queue.empty():
+            super().flush()
+
+
 # Configure detailed logging for agent interactions
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('agent_interactions.log', encoding='utf-8', mode='a'),
-        logging.StreamHandler()
-    ]
-)
+def _configure_logging() -> None:
+    """Send log records through a queue so file/console writes run on a background thread.
+
+    Like logging.basicConfig, this is a no-op when the root logger already has handlers.
+    That includes the QueueHandler installed by a previous run, so a re-executed copy of
+    this module (e.g. an ADK web reload) cannot start a second listener.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler = _BatchingFileHandler('agent_interactions.log', log_queue, encoding='utf-8', mode='a')
+    stream_handler = logging.StreamHandler()
+    file_handler.setFormatter(formatter)
+    stream_handler.setFormatter(formatter)
+
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Drain pending records on interpreter shutdown
+    atexit.register(listener.stop)
+
+_configure_logging()
 
 # Token counting utilities
 def estimate_tokens(text: str) -> int:
@@ -121,39 +168,276 @@ def estimate_tokens(text: str) -> int:
         return 0
     return len(text) // 4
 
+def _read_log_sample_rate() -> float:
+    """AGENT_LOG_SAMPLE clamped to [0, 1]; a malformed value logs everything rather than failing import"""
+    raw = os.getenv("AGENT_LOG_SAMPLE", "1.0")
+    try:
+        rate = float(raw)
+    except ValueError:
+        logger.warning(f"Ignoring invalid AGENT_LOG_SAMPLE={raw!r}; logging every interaction")
+        return 1.0
+    if rate != rate:  # NaN
+        return 1.0
+    return min(1.0, max(0.0, rate))
+
+# Fraction of interactions written to the log (1.0 = all), read once at import
+_LOG_SAMPLE_RATE = _read_log_sample_rate()
+
 def log_agent_interaction(interaction_type: str, data: Dict[str, Any], tokens: Optional[int] = None):
     """Log agent interactions with detailed information"""
+    # Skip building/serializing the payload when it would be filtered out anyway
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    if _LOG_SAMPLE_RATE < 1.0 and random.random() >= _LOG_SAMPLE_RATE:
+        return
     log_entry = {
         "timestamp": time.time(),
         "type": interaction_type,
         "data": data,
         "tokens": tokens
     }
-    logger.info(f"AGENT_INTERACTION: {json.dumps(log_entry, ensure_ascii=False, indent=2)}")
-
-# Create agent with static_instruction as types.Content for ADK 1.15
-from google.genai import types
-
-
-# Direct agent creation without wrapper overhead
-root_agent = Agent(
-    model=PRIMARY_MODEL,
-    name="mmvn_agent",
-    static_instruction=types.Content(
-        parts=[types.Part(text=MMVN_AGENT_INSTRUCTION)]
-    ),
-    tools=[
-        search_products,
-        explore_product,
-        compare_products,
-        load_memory,
-        memorize,
-        memorize_list,
-        get_memory,
-        store_search_memory,
-    ],
-    output_key="mmvn_agent",
+    # Compact single-line JSON: cheaper to encode and parseable line-by-line by agent_analytics
+    logger.info(f"AGENT_INTERACTION: {json_utils.dumps(log_entry)}")
+
+# --- Gemini explicit context caching for the static prefix ---
+# One process-wide cache per (model, instruction) instead of one per session, so the
+# prefilled system instruction + tool declarations are reused by every turn.
+_STATIC_CACHE_TTL_SECONDS = int(os.getenv("MMVN_STATIC_CACHE_TTL", "3600"))
+# Refresh a little before the server-side expiry so a request never references a dead cache
+_STATIC_CACHE_REFRESH_MARGIN = 60
+# Start the background re-create this long before a live cache stops being used,
+# so requests keep hitting the old cache instead of falling back to the full prompt
+_STATIC_CACHE_REFRESH_AHEAD = min(300, _STATIC_CACHE_TTL_SECONDS // 4)
+# After a failed create (quota, prompt below the minimum cacheable size, ...) wait before retrying
+_STATIC_CACHE_RETRY_SECONDS = 300
+_INSTRUCTION_SHA = hashlib.blake2b(MMVN_AGENT_INSTRUCTION.encode("utf-8"), digest_size=16).hexdigest()
+
+# (cache_model, instruction_sha) -> (cache_name or "" after a failure, expires_at)
+_STATIC_CACHES: Dict[Tuple[str, str], Tuple[str, float]] = {}
+# In-flight background refreshes, one per key. Only touched from the event loop thread.
+_STATIC_CACHE_TASKS: Dict[Tuple[str, str], "asyncio.Task[None]"] = {}
+
+# Cache names survive restarts: a cold start with an unchanged prompt reuses the live cache
+# instead of paying another caches.create round-trip.
+_STATIC_CACHE_REF_PATH = os.path.join(
+    os.path.expanduser(os.getenv("MMVN_CACHE_DIR", "~/.cache/mmvn")), "cache_ref.json"
 )
 
-# Required export for ADK web UI
-agent = root_agent
+
+def _prefix_fingerprint(config: "types.GenerateContentConfig") -> str:
+    """Hash everything that goes into the cache (instruction, tool declarations, tool config).
+
+    The instruction SHA alone is not enough across restarts: a changed tool signature
+    must not be served from a cache built for the old declarations.
+    """
+    prefix = config.model_dump(
+        mode="json", include={"system_instruction", "tools", "tool_config"}, exclude_none=True
+    )
+    return hashlib.blake2b(json_utils.dumps_bytes(prefix), digest_size=16).hexdigest()
+
+
+def _load_cache_ref(cache_model: str, fingerprint: str) -> Optional[Tuple[str, float]]:
+    """Return a still-valid (cache_name, expires_at) persisted by a previous process."""
+    try:
+        with open(_STATIC_CACHE_REF_PATH, "rb") as f:
+            refs = json_utils.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.debug(f"Ignoring unreadable cache ref {_STATIC_CACHE_REF_PATH}: {e}")
+        return None
+
+    ref = refs.get(f"{cache_model}:{_INSTRUCTION_SHA}") if isinstance(refs, dict) else None
+    if not isinstance(ref, dict) or ref.get("fingerprint") != fingerprint or not ref.get("name"):
+        return None
+    expires_at = float(ref.get("expires_at", 0))
+    if expires_at <= time.time():
+        return None
+    return ref["name"], expires_at
+
+
+def _save_cache_ref(cache_model: str, fingerprint: str, entry: Tuple[str, float]) -> None:
+    """Persist a freshly created cache so the next process can reuse it until expiry."""
+    try:
+        with open(_STATIC_CACHE_REF_PATH, "rb") as f:
+            refs = json_utils.loads(f.read())
+        if not isinstance(refs, dict):
+            refs = {}
+    except (OSError, ValueError):
+        refs = {}
+
+    now = time.time()
+    refs = {k: v for k, v in refs.items() if isinstance(v, dict) and v.get("expires_at", 0) > now}
+    refs[f"{cache_model}:{_INSTRUCTION_SHA}"] = {
+        "sha": _INSTRUCTION_SHA,
+        "fingerprint": fingerprint,
+        "name": entry[0],
+        "expires_at": entry[1],
+    }
+    # Write to a per-process temp file and rename over the target, so a crash or a
+    # concurrent writer never leaves a half-written cache_ref.json behind.
+    tmp_path = f"{_STATIC_CACHE_REF_PATH}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(_STATIC_CACHE_REF_PATH), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(json_utils.dumps_bytes(refs))
+        os.replace(tmp_path, _STATIC_CACHE_REF_PATH)
+    except OSError as e:
+        logger.debug(f"Could not persist cache ref {_STATIC_CACHE_REF_PATH}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+_CLIENT: Optional["genai.Client"] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _get_client() -> "genai.Client":
+    """Return the process-wide genai.Client, creating it on first use."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                from google import genai
+                _CLIENT = genai.Client()
+    return _CLIENT
+
+
+async def _create_static_cache(cache_model: str, config: "types.GenerateContentConfig") -> Tuple[str, float]:
+    """Create a Gemini cache holding the request's system instruction and tools."""
+    from google.genai import types
+
+    now = time.time()
+    try:
+        client = _get_client()
+        cache = await client.aio.caches.create(
+            model=cache_model,
+            config=types.CreateCachedContentConfig(
+                display_name=f"mmvn-static-{_INSTRUCTION_SHA[:12]}",
+                system_instruction=config.system_instruction,
+                tools=config.tools,
+                tool_config=config.tool_config,
+                ttl=f"{_STATIC_CACHE_TTL_SECONDS}s",
+            ),
+        )
+    except Exception as e:
+        logger.warning(f"Static instruction cache unavailable for {cache_model}: {e}")
+        return "", now + _STATIC_CACHE_RETRY_SECONDS
+    logger.info(f"Created static instruction cache {cache.name} for {cache_model}")
+    return cache.name, now + _STATIC_CACHE_TTL_SECONDS - _STATIC_CACHE_REFRESH_MARGIN
+
+
+async def _refresh_static_cache(key: Tuple[str, str], config: "types.GenerateContentConfig") -> None:
+    """Background task: reuse a persisted cache or create a new one, then publish the entry."""
+    cache_model = key[0]
+    fingerprint = _prefix_fingerprint(config)
+    # First miss in this process: try the cache a previous process left behind
+    entry = None
+    if key not in _STATIC_CACHES:
+        entry = await asyncio.to_thread(_load_cache_ref, cache_model, fingerprint)
+    if entry is None:
+        entry = await _create_static_cache(cache_model, config)
+        if entry[0]:
+            await asyncio.to_thread(_save_cache_ref, cache_model, fingerprint, entry)
+    else:
+        logger.debug(f"Reusing static instruction cache {entry[0]} for {cache_model}")
+    _STATIC_CACHES[key] = entry
+
+
+def _schedule_static_cache_refresh(key: Tuple[str, str], config: "types.GenerateContentConfig") -> None:
+    """Start a refresh for key unless one is already running; never waits for it."""
+    task = _STATIC_CACHE_TASKS.get(key)
+    if task is not None and not task.done():
+        return
+    # Shallow copy: the caller clears the prefix fields on its own request afterwards
+    task = asyncio.get_running_loop().create_task(_refresh_static_cache(key, config.model_copy()))
+    _STATIC_CACHE_TASKS[key] = task
+    task.add_done_callback(functools.partial(_static_cache_task_done, key))
+
+
+def _static_cache_task_done(key: Tuple[str, str], task: "asyncio.Task[None]") -> None:
+    if _STATIC_CACHE_TASKS.get(key) is task:
+        del _STATIC_CACHE_TASKS[key]
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Static instruction cache refresh failed for {key[0]}: {task.exception()}")
+
+
+async def _static_cache_before_model(callback_context, llm_request):
+    """before_model_callback: point the request at the shared static-prefix cache.
+
+    Gemini rejects requests that set system_instruction/tools/tool_config together with
+    cached_content, so those move into the cache and are cleared from the request.
+    The cache is created by a background task (client.aio, off the request path); until it
+    is ready, requests go out with the full uncached prompt.
+    The cache key assumes the callback is attached to a single agent whose tools and
+    instruction are fixed for the life of the process.
+    """
+    config = llm_request.config
+    # Nothing to move: no static prefix, or the request is already wired to a cache
+    if config is None or config.cached_content or not config.system_instruction:
+        return None
+
+    cache_model = llm_request.model or PRIMARY_MODEL
+    key = (cache_model, _INSTRUCTION_SHA)
+    entry = _STATIC_CACHES.get(key)
+    now = time.time()
+    if entry is None or entry[1] <= now:
+        _schedule_static_cache_refresh(key, config)
+        return None
+
+    cache_name = entry[0]
+    if not cache_name:
+        # Cache creation failed recently: send the full prompt
+        return None
+    if entry[1] - now <= _STATIC_CACHE_REFRESH_AHEAD:
+        # Close to expiry: re-create in the background, keep using the live cache meanwhile
+        _schedule_static_cache_refresh(key, config)
+
+    config.cached_content = cache_name
+    config.system_instruction = None
+    config.tools = None
+    config.tool_config = None
+    return None
+
+@functools.cache
+def _build_root_agent() -> "Agent":
+    """Build the root agent; ADK, google.genai and the tool modules are imported here."""
+    from google.adk.agents import Agent
+    from google.adk.tools import load_memory
+    from google.genai import types
+
+    from app.tools.search import search_products
+    from app.tools.explore import explore_product
+    from app.tools.compare import compare_products
+    from app.tools.memory_tools import memorize, memorize_list, get_memory, store_search_memory
+
+    # Create agent with static_instruction as types.Content for ADK 1.15.
+    # The static prompt never changes: its Part/Content are built once here.
+    static_content = types.Content(parts=[types.Part(text=MMVN_AGENT_INSTRUCTION)])
+
+    # Direct agent creation without wrapper overhead
+    return Agent(
+        model=PRIMARY_MODEL,
+        name="mmvn_agent",
+        static_instruction=static_content,
+        tools=[
+            search_products,
+            explore_product,
+            compare_products,
+            load_memory,
+            memorize,
+            memorize_list,
+            get_memory,
+            store_search_memory,
+        ],
+        output_key="mmvn_agent",
+        before_model_callback=_static_cache_before_model,
+    )
+
+def __getattr__(name):
+    # root_agent / agent (the ADK web UI export) are built on first access, so importing
+    # app.agent for its callbacks and helpers does not pull in ADK and the tool modules
+    if name in ("root_agent", "agent"):
+        return _build_root_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
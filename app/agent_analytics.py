@@ -3,75 +3,207 @@ Agent Analytics và Token Counting Utilities
 Phân tích logs và tính toán thống kê về agent performance
 """
 
-import json
 import logging
-import re
-from datetime import datetime, timedelta
+import mmap
+import os
+import sys
+import time
+from datetime import datetime
 from typing import Dict, List, Any, Optional
-from collections import defaultdict, Counter
-import statistics
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.shared_libraries import json_utils
+from app.shared_libraries.log_parsing import AGENT_INTERACTION_RE, CUTOFF_SLACK_SECONDS, bisect_log_offset
 
 logger = logging.getLogger(__name__)
 
+# Interaction types counted as model input / output in the overall token split
+INPUT_TYPES = frozenset({"INPUT_RECEIVED", "PROMPT_ENHANCED"})
+OUTPUT_TYPES = frozenset({"LLM_RESPONSE"})
+
+# Smallest byte span worth handing to a separate worker process
+_MIN_PARALLEL_SPAN = 4 << 20
+# parse_logs fans out to worker processes once this many bytes need parsing
+_PARALLEL_PARSE_MIN_BYTES = 64 << 20
+
+
+def _parse_log_span(log_file: str, start: int, end: int, cutoff_ts: float):
+    """Worker for _scan_span_parallel: parse one byte span, return its columns"""
+    partial = AgentAnalytics(log_file)
+    with open(log_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        partial._scan_span(mm, start, end, cutoff_ts)
+    return partial._columns()
+
+
 class AgentAnalytics:
     """Phân tích và thống kê agent performance từ logs"""
     
     def __init__(self, log_file: str = "agent_interactions.log"):
         self.log_file = log_file
-        self.sessions = defaultdict(list)
         self.tool_usage = defaultdict(list)
-        self.token_stats = defaultdict(list)
+        self._reset_columns()
+
+    def _reset_columns(self):
+        """Parsed entries are kept column-wise (struct of arrays), one row per log entry"""
+        self._ts: List[float] = []
+        self._type: List[str] = []
+        self._session: List[str] = []
+        self._tokens: List[int] = []
+        self._data: List[Dict[str, Any]] = []
+        # Incremental parse state: (file identity, hours_back, parsed byte offset, mtime_ns)
+        self._parse_state: Optional[tuple] = None
+        self._cached_analytics: Optional[Dict[str, Any]] = None
+        self._oldest_ts = float("inf")
+        # Per-session aggregates of the current rows, computed once per parse
+        self._type_enc: Optional[tuple] = None
+        self._session_agg: Optional[tuple] = None
+        self._session_summaries: Optional[List[Dict[str, Any]]] = None
+
+    def _columns(self):
+        return self._ts, self._type, self._session, self._tokens, self._data
+
+    def _trim_columns(self, cutoff_ts: float):
+        """Drop rows that slid out of the time window since they were parsed"""
+        if not self._ts:
+            self._oldest_ts = float("inf")
+            return
+        ts = np.asarray(self._ts, dtype=np.float64)
+        if ts.min() < cutoff_ts:
+            keep = np.flatnonzero(ts >= cutoff_ts).tolist()
+            self._ts, self._type, self._session, self._tokens, self._data = (
+                [column[i] for i in keep] for column in self._columns()
+            )
+            ts = ts[keep]
+        self._oldest_ts = ts.min().item() if ts.size else float("inf")
         
     def parse_logs(self, hours_back: int = 24) -> Dict[str, Any]:
-        """Parse logs từ file và trích xuất thống kê"""
+        """Parse logs từ file và trích xuất thống kê
+
+        Repeated calls are incremental: while the file only grows, only the bytes appended
+        since the previous call are parsed and rows that fell out of the window are dropped.
+        An unchanged file returns the memoized analytics.
+        """
         try:
-            cutoff_time = datetime.now() - timedelta(hours=hours_back)
+            # Epoch seconds throughout: entries are compared as raw floats, no datetime per line
+            cutoff_ts = time.time() - hours_back * 3600
+            stop_ts = cutoff_ts - CUTOFF_SLACK_SECONDS
             
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if "AGENT_INTERACTION:" in line:
-                        try:
-                            # Extract JSON from log line
-                            json_start = line.find('{')
-                            if json_start != -1:
-                                log_data = json.loads(line[json_start:])
-                                self._process_log_entry(log_data, cutoff_time)
-                        except json.JSONDecodeError:
-                            continue
-                            
-            return self._generate_analytics()
+            with open(self.log_file, 'rb') as f:
+                st = os.fstat(f.fileno())
+                file_id = (st.st_dev, st.st_ino)
+                state = self._parse_state
+                incremental = (
+                    state is not None and state[0] == file_id and state[1] == hours_back and st.st_size >= state[2]
+                )
+                if (
+                    incremental
+                    and st.st_size == state[2]
+                    and st.st_mtime_ns == state[3]
+                    and self._oldest_ts >= cutoff_ts
+                    and self._cached_analytics is not None
+                ):
+                    return dict(self._cached_analytics)
+                if not incremental:
+                    self._reset_columns()
+
+                end = 0
+                if st.st_size > 0:
+                    # Memory-mapped scan: the regex walks the raw bytes in C, skips lines without the
+                    # marker without creating Python objects, and starts at the time window's offset
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        # Stop at the last complete line; a partially written one is picked up next call
+                        end = mm.rfind(b"\n") + 1
+                        start = state[2] if incremental else bisect_log_offset(mm, AGENT_INTERACTION_RE, stop_ts)
+                        if end - start >= _PARALLEL_PARSE_MIN_BYTES:
+                            self._scan_span_parallel(mm, start, end, cutoff_ts)
+                        else:
+                            self._scan_span(mm, start, end, cutoff_ts)
+
+            self._trim_columns(cutoff_ts)
+            self._parse_state = (file_id, hours_back, end, st.st_mtime_ns)
+            self._cached_analytics = self._generate_analytics()
+            return dict(self._cached_analytics)
             
         except FileNotFoundError:
+            self._reset_columns()
             logger.warning(f"Log file {self.log_file} not found")
             return {"error": "Log file not found"}
         except Exception as e:
+            self._reset_columns()
             logger.error(f"Error parsing logs: {e}")
             return {"error": str(e)}
+
+    def _scan_span_parallel(self, buf, start: int, end: int, cutoff_ts: float):
+        """Like _scan_span, split over worker processes (for large spans)
+
+        buf[start:end] is cut into newline-aligned byte spans; each worker process maps the
+        file, parses its span and returns its columns, which are appended here in file
+        order, so the rows match a single-process scan.
+        """
+        # Process start-up costs more than parsing a few MB: keep spans reasonably large
+        workers = min(os.cpu_count() or 1, max(1, (end - start) // _MIN_PARALLEL_SPAN))
+        if workers == 1:
+            self._scan_span(buf, start, end, cutoff_ts)
+            return
+
+        bounds = [start]
+        for i in range(1, workers):
+            nl = buf.find(b"\n", start + (end - start) * i // workers, end)
+            bounds.append(end if nl == -1 else max(nl + 1, bounds[-1]))
+        bounds.append(end)
+
+        spans = [(bounds[i], bounds[i + 1]) for i in range(workers) if bounds[i] < bounds[i + 1]]
+        with ProcessPoolExecutor(max_workers=len(spans)) as pool:
+            futures = [
+                pool.submit(_parse_log_span, self.log_file, span_start, span_end, cutoff_ts)
+                for span_start, span_end in spans
+            ]
+            for future in futures:
+                for column, part in zip(self._columns(), future.result()):
+                    column.extend(part)
+
+    def _scan_span(self, buf, start: int, end: int, cutoff_ts: float):
+        """Process every AGENT_INTERACTION entry in buf[start:end]"""
+        for m in AGENT_INTERACTION_RE.finditer(buf, start, end):
+            try:
+                log_data = json_utils.loads(m.group(1))
+            except ValueError:
+                # JSONDecodeError or a line that is not valid UTF-8
+                continue
+            self._process_log_entry(log_data, cutoff_ts)
     
-    def _process_log_entry(self, log_data: Dict[str, Any], cutoff_time: datetime):
+    def _process_log_entry(self, log_data: Dict[str, Any], cutoff_ts: float):
         """Process individual log entry"""
         try:
-            timestamp = datetime.fromtimestamp(log_data.get('timestamp', 0))
-            if timestamp < cutoff_time:
+            timestamp = log_data.get('timestamp', 0)
+            if timestamp < cutoff_ts:
                 return
                 
-            interaction_type = log_data.get('type', '')
             data = log_data.get('data', {})
-            tokens = log_data.get('tokens', 0)
-            
-            # Group by session
             session_id = data.get('session_id', 'unknown')
-            self.sessions[session_id].append(log_data)
-            
-            # Track token usage
-            if tokens > 0:
-                self.token_stats[interaction_type].append(tokens)
+            tokens = log_data.get('tokens', 0)
+            if not isinstance(tokens, (int, float)):
+                tokens = 0
+
+            # One append per column; grouping by session/type happens in the stats pass
+            self._ts.append(timestamp)
+            self._type.append(log_data.get('type', 'unknown'))
+            self._session.append(session_id)
+            self._tokens.append(tokens)
+            self._data.append(data)
                 
         except Exception as e:
             logger.warning(f"Error processing log entry: {e}")
     
     def _generate_analytics(self) -> Dict[str, Any]:
         """Generate comprehensive analytics"""
+        # Encode once; one grouped pass then feeds the summary, the session analysis and session_summaries()
+        self._type_enc = self._encode_types()
+        self._session_agg = self._reduce_sessions()
+        self._session_summaries = None
         analytics = {
             "summary": self._get_summary_stats(),
             "token_analysis": self._get_token_analysis(),
@@ -83,14 +215,12 @@ class AgentAnalytics:
     
     def _get_summary_stats(self) -> Dict[str, Any]:
         """Get summary statistics"""
-        total_sessions = len(self.sessions)
-        total_interactions = sum(len(session) for session in self.sessions.values())
+        session_ids, _, _, _, _, type_counts, type_names = self._session_agg
+        total_sessions = len(session_ids)
+        total_interactions = len(self._type)
         
         # Count interaction types
-        interaction_counts = Counter()
-        for session in self.sessions.values():
-            for entry in session:
-                interaction_counts[entry.get('type', 'unknown')] += 1
+        interaction_counts = dict(zip(type_names, type_counts.sum(axis=0).tolist()))
         
         return {
             "total_sessions": total_sessions,
@@ -103,91 +233,140 @@ class AgentAnalytics:
         """Analyze token usage patterns"""
         token_analysis = {}
         
-        # Separate input and output tokens
-        input_tokens = []
-        output_tokens = []
-        
-        for interaction_type, tokens in self.token_stats.items():
-            if tokens:
-                token_analysis[interaction_type] = {
-                    "count": len(tokens),
-                    "total_tokens": sum(tokens),
-                    "avg_tokens": statistics.mean(tokens),
-                    "min_tokens": min(tokens),
-                    "max_tokens": max(tokens),
-                    "median_tokens": statistics.median(tokens)
-                }
-                
-                # Categorize tokens by type
-                if interaction_type in ["INPUT_RECEIVED", "PROMPT_ENHANCED"]:
-                    input_tokens.extend(tokens)
-                elif interaction_type in ["LLM_RESPONSE"]:
-                    output_tokens.extend(tokens)
+        tidx, type_names, tokens = self._type_enc
+        positive = tokens > 0
+        pos_tidx, pos_tokens = tidx[positive], tokens[positive]
+
+        # Types in order of their first positive token count
+        present, first_seen = np.unique(pos_tidx, return_index=True)
+        for code in present[np.argsort(first_seen)].tolist():
+            # Reductions run in NumPy; .item() converts back to JSON-serializable Python scalars
+            a = pos_tokens[pos_tidx == code]
+            token_analysis[type_names[code]] = {
+                "count": a.size,
+                "total_tokens": a.sum().item(),
+                "avg_tokens": a.mean().item(),
+                "min_tokens": a.min().item(),
+                "max_tokens": a.max().item(),
+                "median_tokens": np.median(a).item()
+            }
         
         # Calculate total token usage with actual input/output split
-        all_tokens = [token for tokens in self.token_stats.values() for token in tokens]
-        if all_tokens:
+        if pos_tokens.size:
+            # Categorize tokens by type: one mask over the integer type codes per category
+            input_codes = [i for i, t in enumerate(type_names) if t in INPUT_TYPES]
+            output_codes = [i for i, t in enumerate(type_names) if t in OUTPUT_TYPES]
+            total = pos_tokens.sum().item()
+            input_total = pos_tokens[np.isin(pos_tidx, input_codes)].sum().item()
+            output_total = pos_tokens[np.isin(pos_tidx, output_codes)].sum().item()
             token_analysis["overall"] = {
-                "total_tokens": sum(all_tokens),
-                "input_tokens": sum(input_tokens),
-                "output_tokens": sum(output_tokens),
+                "total_tokens": total,
+                "input_tokens": input_total,
+                "output_tokens": output_total,
                 "input_output_ratio": {
-                    "input_percentage": (sum(input_tokens) / sum(all_tokens) * 100) if all_tokens else 0,
-                    "output_percentage": (sum(output_tokens) / sum(all_tokens) * 100) if all_tokens else 0
+                    "input_percentage": (input_total / total * 100) if total else 0,
+                    "output_percentage": (output_total / total * 100) if total else 0
                 },
-                "avg_tokens_per_interaction": statistics.mean(all_tokens),
-                "total_interactions": len(all_tokens)
+                "avg_tokens_per_interaction": pos_tokens.mean().item(),
+                "total_interactions": pos_tokens.size
             }
         
         return token_analysis
     
     def _get_session_analysis(self) -> Dict[str, Any]:
         """Analyze session patterns"""
-        session_lengths = [len(session) for session in self.sessions.values()]
-        session_durations = []
-        
-        for session_id, session in self.sessions.items():
-            if len(session) > 1:
-                start_time = min(entry.get('timestamp', 0) for entry in session)
-                end_time = max(entry.get('timestamp', 0) for entry in session)
-                duration = end_time - start_time
-                session_durations.append(duration)
+        _, start, end, count, _, _, _ = self._session_agg
+        durations = (end - start)[count > 1]
         
         return {
-            "total_sessions": len(self.sessions),
-            "avg_session_length": statistics.mean(session_lengths) if session_lengths else 0,
-            "max_session_length": max(session_lengths) if session_lengths else 0,
-            "avg_session_duration": statistics.mean(session_durations) if session_durations else 0,
-            "max_session_duration": max(session_durations) if session_durations else 0
+            "total_sessions": count.size,
+            "avg_session_length": count.mean().item() if count.size else 0,
+            "max_session_length": count.max().item() if count.size else 0,
+            "avg_session_duration": durations.mean().item() if durations.size else 0,
+            "max_session_duration": durations.max().item() if durations.size else 0
         }
     
     def _get_performance_metrics(self) -> Dict[str, Any]:
         """Get performance metrics from logs"""
         performance_data = defaultdict(list)
         
-        for session in self.sessions.values():
-            for entry in session:
-                data = entry.get('data', {})
-                if 'total_processing_time' in data:
-                    performance_data['total_time'].append(data['total_processing_time'])
-                if 'llm_processing_time' in data:
-                    performance_data['llm_time'].append(data['llm_processing_time'])
-                if 'memory_search_time' in data:
-                    performance_data['memory_time'].append(data['memory_search_time'])
+        for data in self._data:
+            if 'total_processing_time' in data:
+                performance_data['total_time'].append(data['total_processing_time'])
+            if 'llm_processing_time' in data:
+                performance_data['llm_time'].append(data['llm_processing_time'])
+            if 'memory_search_time' in data:
+                performance_data['memory_time'].append(data['memory_search_time'])
         
         metrics = {}
         for metric, values in performance_data.items():
             if values:
+                a = np.asarray(values, dtype=np.float64)
                 metrics[metric] = {
-                    "avg": statistics.mean(values),
-                    "min": min(values),
-                    "max": max(values),
-                    "median": statistics.median(values),
-                    "count": len(values)
+                    "avg": a.mean().item(),
+                    "min": a.min().item(),
+                    "max": a.max().item(),
+                    "median": np.median(a).item(),
+                    "count": a.size
                 }
         
         return metrics
     
+    def _encode_types(self):
+        """Intern interaction types to dense int codes (first-seen order); also the token column as an array"""
+        type_codes: Dict[str, int] = {}
+        n = len(self._type)
+        tidx = np.fromiter((type_codes.setdefault(t, len(type_codes)) for t in self._type), dtype=np.intp, count=n)
+        tokens = np.asarray(self._tokens) if n else np.zeros(0, dtype=np.int64)
+        return tidx, list(type_codes), tokens
+
+    def _reduce_sessions(self):
+        """Group the columns by session with NumPy scatter-reductions (one pass each, in C).
+
+        Session ids and interaction types are interned to dense int codes; per-session
+        start/end come from minimum.at/maximum.at, counts and token sums from bincount and
+        per-type counts from a bincount over (session, type) pairs.
+        """
+        tidx, type_names, tokens = self._type_enc
+        session_codes: Dict[str, int] = {}
+        n = len(self._session)
+        sidx = np.fromiter((session_codes.setdefault(s, len(session_codes)) for s in self._session), dtype=np.intp, count=n)
+        n_sessions, n_types = len(session_codes), len(type_names)
+
+        ts = np.asarray(self._ts, dtype=np.float64)
+        start = np.full(n_sessions, np.inf)
+        end = np.full(n_sessions, -np.inf)
+        np.minimum.at(start, sidx, ts)
+        np.maximum.at(end, sidx, ts)
+        count = np.bincount(sidx, minlength=n_sessions)
+        token_sum = np.bincount(sidx, weights=tokens, minlength=n_sessions).astype(tokens.dtype)
+        type_counts = np.bincount(sidx * n_types + tidx, minlength=n_sessions * n_types).reshape(n_sessions, n_types)
+        return list(session_codes), start, end, count, token_sum, type_counts, type_names
+
+    def session_summaries(self) -> List[Dict[str, Any]]:
+        """Per-session start/end, interaction counts and token totals from the last parse"""
+        if self._session_summaries is not None:
+            return self._session_summaries
+        if self._session_agg is None:
+            self._type_enc = self._encode_types()
+            self._session_agg = self._reduce_sessions()
+        session_ids, start, end, count, token_sum, type_counts, type_names = self._session_agg
+        start_l, end_l, count_l, tokens_l = start.tolist(), end.tolist(), count.tolist(), token_sum.tolist()
+        self._session_summaries = [
+            {
+                "session_id": session_id,
+                "start_time": start_l[i],
+                "end_time": end_l[i],
+                "duration": end_l[i] - start_l[i],
+                "interaction_count": count_l[i],
+                "interaction_types": {type_names[j]: int(type_counts[i, j]) for j in np.flatnonzero(type_counts[i])},
+                "total_tokens": tokens_l[i],
+                "last_activity": end_l[i]
+            }
+            for i, session_id in enumerate(session_ids)
+        ]
+        return self._session_summaries
+
     def _get_tool_usage_stats(self) -> Dict[str, Any]:
         """Get tool usage statistics"""
         # This would need to be populated from tool logs
@@ -204,71 +383,74 @@ class AgentAnalytics:
             print(f"Error: {analytics['error']}")
             return
         
-        print("=" * 80)
-        print("AGENT ANALYTICS REPORT")
-        print("=" * 80)
-        print(f"Time Period: Last {hours_back} hours")
-        print(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print()
+        # Build the whole report, then write it once instead of ~40 line-buffered print() calls
+        out = []
+        out.append("=" * 80)
+        out.append("AGENT ANALYTICS REPORT")
+        out.append("=" * 80)
+        out.append(f"Time Period: Last {hours_back} hours")
+        out.append(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        out.append("")
         
         # Summary
         summary = analytics["summary"]
-        print("📊 SUMMARY STATISTICS")
-        print("-" * 40)
-        print(f"Total Sessions: {summary['total_sessions']}")
-        print(f"Total Interactions: {summary['total_interactions']}")
-        print(f"Avg Interactions/Session: {summary['avg_interactions_per_session']:.2f}")
-        print()
+        out.append("📊 SUMMARY STATISTICS")
+        out.append("-" * 40)
+        out.append(f"Total Sessions: {summary['total_sessions']}")
+        out.append(f"Total Interactions: {summary['total_interactions']}")
+        out.append(f"Avg Interactions/Session: {summary['avg_interactions_per_session']:.2f}")
+        out.append("")
         
         # Token Analysis
         token_analysis = analytics["token_analysis"]
         if token_analysis:
-            print("🔢 TOKEN USAGE ANALYSIS")
-            print("-" * 40)
+            out.append("🔢 TOKEN USAGE ANALYSIS")
+            out.append("-" * 40)
             
             if "overall" in token_analysis:
                 overall = token_analysis["overall"]
-                print(f"Total Tokens Used: {overall['total_tokens']:,}")
-                print(f"  Input Tokens: {overall['input_tokens']:,} ({overall['input_output_ratio']['input_percentage']:.1f}%)")
-                print(f"  Output Tokens: {overall['output_tokens']:,} ({overall['input_output_ratio']['output_percentage']:.1f}%)")
-                print(f"Avg Tokens/Interaction: {overall['avg_tokens_per_interaction']:.1f}")
-                print(f"Total Interactions: {overall['total_interactions']}")
-                print()
+                out.append(f"Total Tokens Used: {overall['total_tokens']:,}")
+                out.append(f"  Input Tokens: {overall['input_tokens']:,} ({overall['input_output_ratio']['input_percentage']:.1f}%)")
+                out.append(f"  Output Tokens: {overall['output_tokens']:,} ({overall['input_output_ratio']['output_percentage']:.1f}%)")
+                out.append(f"Avg Tokens/Interaction: {overall['avg_tokens_per_interaction']:.1f}")
+                out.append(f"Total Interactions: {overall['total_interactions']}")
+                out.append("")
             
             for interaction_type, stats in token_analysis.items():
                 if interaction_type != "overall":
-                    print(f"{interaction_type}:")
-                    print(f"  Count: {stats['count']}")
-                    print(f"  Total Tokens: {stats['total_tokens']:,}")
-                    print(f"  Avg Tokens: {stats['avg_tokens']:.1f}")
-                    print(f"  Min/Max: {stats['min_tokens']}/{stats['max_tokens']}")
-                    print()
+                    out.append(f"{interaction_type}:")
+                    out.append(f"  Count: {stats['count']}")
+                    out.append(f"  Total Tokens: {stats['total_tokens']:,}")
+                    out.append(f"  Avg Tokens: {stats['avg_tokens']:.1f}")
+                    out.append(f"  Min/Max: {stats['min_tokens']}/{stats['max_tokens']}")
+                    out.append("")
         
         # Performance Metrics
         performance = analytics["performance_metrics"]
         if performance:
-            print("⚡ PERFORMANCE METRICS")
-            print("-" * 40)
+            out.append("⚡ PERFORMANCE METRICS")
+            out.append("-" * 40)
             for metric, stats in performance.items():
-                print(f"{metric.replace('_', ' ').title()}:")
-                print(f"  Avg: {stats['avg']:.3f}s")
-                print(f"  Min/Max: {stats['min']:.3f}s / {stats['max']:.3f}s")
-                print(f"  Median: {stats['median']:.3f}s")
-                print()
+                out.append(f"{metric.replace('_', ' ').title()}:")
+                out.append(f"  Avg: {stats['avg']:.3f}s")
+                out.append(f"  Min/Max: {stats['min']:.3f}s / {stats['max']:.3f}s")
+                out.append(f"  Median: {stats['median']:.3f}s")
+                out.append("")
         
         # Session Analysis
         session_analysis = analytics["session_analysis"]
-        print("👥 SESSION ANALYSIS")
-        print("-" * 40)
-        print(f"Total Sessions: {session_analysis['total_sessions']}")
-        print(f"Avg Session Length: {session_analysis['avg_session_length']:.1f} interactions")
-        print(f"Max Session Length: {session_analysis['max_session_length']} interactions")
+        out.append("👥 SESSION ANALYSIS")
+        out.append("-" * 40)
+        out.append(f"Total Sessions: {session_analysis['total_sessions']}")
+        out.append(f"Avg Session Length: {session_analysis['avg_session_length']:.1f} interactions")
+        out.append(f"Max Session Length: {session_analysis['max_session_length']} interactions")
         if session_analysis['avg_session_duration'] > 0:
-            print(f"Avg Session Duration: {session_analysis['avg_session_duration']:.1f} seconds")
-            print(f"Max Session Duration: {session_analysis['max_session_duration']:.1f} seconds")
-        print()
+            out.append(f"Avg Session Duration: {session_analysis['avg_session_duration']:.1f} seconds")
+            out.append(f"Max Session Duration: {session_analysis['max_session_duration']:.1f} seconds")
+        out.append("")
         
-        print("=" * 80)
+        out.append("=" * 80)
+        sys.stdout.write("\n".join(out) + "\n")
 
 def estimate_cost(input_tokens: int, output_tokens: int = 0, model: str = "gemini-2.5-flash-lite") -> Dict[str, float]:
     """Estimate cost based on actual input/output token usage"""
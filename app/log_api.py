@@ -2,17 +2,20 @@
 API endpoints để serve logs và analytics data
 """
 
-import json
+import csv
+import io
 import logging
 import os
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
 from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import asyncio
 from app.agent_analytics import AgentAnalytics, estimate_cost_from_analytics
+from app.shared_libraries import json_utils
+from app.shared_libraries.log_parsing import CUTOFF_SLACK_SECONDS, MARKER_RE, match_marker, reverse_line_iter
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +60,51 @@ async def get_analytics(
         logger.error(f"Error getting analytics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _scan_logs(
+    cutoff_ts: float,
+    limit: int,
+    log_type: Optional[str] = None,
+    session_id: Optional[str] = None,
+    end: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Newest-first entries not older than cutoff_ts, reading the log file backwards from end"""
+    logs = []
+    stop_ts = cutoff_ts - CUTOFF_SLACK_SECONDS
+
+    # Read from the tail: newest entries come first, so both the time window and
+    # the limit end the scan early instead of reading the whole file
+    for line in reverse_line_iter(analytics.log_file, end=end):
+        # Cheap substring gate, then one regex pass finds the marker and the JSON payload
+        m = match_marker(line)
+        if m is None:
+            continue
+        try:
+            log_data = json_utils.loads(m.group(1))
+        except ValueError:
+            continue
+
+        ts = log_data.get('timestamp', 0)
+        if ts < stop_ts:
+            break
+        if ts < cutoff_ts:
+            continue
+
+        # Apply filters
+        if log_type and log_data.get('type') != log_type:
+            continue
+
+        if session_id and log_data.get('data', {}).get('session_id') != session_id:
+            continue
+
+        logs.append(log_data)
+
+        if len(logs) >= limit:
+            break
+
+    # Sort by timestamp (newest first)
+    logs.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
+    return logs
+
 @app.get("/api/logs")
 async def get_logs(
     hours_back: int = Query(24, description="Hours to look back"),
@@ -66,42 +114,12 @@ async def get_logs(
 ):
     """Get raw log entries"""
     try:
-        cutoff_time = datetime.now() - timedelta(hours=hours_back)
-        logs = []
-        
         if not os.path.exists(analytics.log_file):
             return {"logs": [], "total": 0}
-        
-        with open(analytics.log_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                if "AGENT_INTERACTION:" in line or "TOOL_USAGE:" in line or "TOOL_COMPLETION:" in line or "TOOL_ERROR:" in line:
-                    try:
-                        json_start = line.find('{')
-                        if json_start != -1:
-                            log_data = json.loads(line[json_start:])
-                            timestamp = datetime.fromtimestamp(log_data.get('timestamp', 0))
-                            
-                            if timestamp < cutoff_time:
-                                continue
-                            
-                            # Apply filters
-                            if log_type and log_data.get('type') != log_type:
-                                continue
-                            
-                            if session_id and log_data.get('data', {}).get('session_id') != session_id:
-                                continue
-                            
-                            logs.append(log_data)
-                            
-                            if len(logs) >= limit:
-                                break
-                                
-                    except json.JSONDecodeError:
-                        continue
-        
-        # Sort by timestamp (newest first)
-        logs.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
-        
+
+        # Epoch seconds: entries are compared as raw floats, no datetime per line
+        logs = _scan_logs(time.time() - hours_back * 3600, limit, log_type, session_id)
+
         return {
             "logs": logs,
             "total": len(logs),
@@ -122,36 +140,10 @@ async def get_sessions(
 ):
     """Get session information"""
     try:
-        data = analytics.parse_logs(hours_back)
-        sessions = {}
-        
-        for session_id, session_logs in analytics.sessions.items():
-            if session_logs:
-                start_time = min(log.get('timestamp', 0) for log in session_logs)
-                end_time = max(log.get('timestamp', 0) for log in session_logs)
-                
-                # Count interactions by type
-                interaction_counts = {}
-                total_tokens = 0
-                
-                for log in session_logs:
-                    log_type = log.get('type', 'unknown')
-                    interaction_counts[log_type] = interaction_counts.get(log_type, 0) + 1
-                    total_tokens += log.get('tokens', 0)
-                
-                sessions[session_id] = {
-                    "session_id": session_id,
-                    "start_time": start_time,
-                    "end_time": end_time,
-                    "duration": end_time - start_time,
-                    "interaction_count": len(session_logs),
-                    "interaction_types": interaction_counts,
-                    "total_tokens": total_tokens,
-                    "last_activity": end_time
-                }
+        analytics.parse_logs(hours_back)
         
         # Sort by last activity
-        sorted_sessions = sorted(sessions.values(), key=lambda x: x['last_activity'], reverse=True)
+        sorted_sessions = sorted(analytics.session_summaries(), key=lambda x: x['last_activity'], reverse=True)
         
         return {
             "sessions": sorted_sessions,
@@ -179,46 +171,176 @@ async def get_log_types():
         ]
     }
 
+# One background task tails the log file for every connected socket
+_WATCH_INTERVAL_SECONDS = 1.0
+# Cap on entries pushed per update when a large burst is appended at once
+_WS_MAX_PUSH = 100
+_watcher_task: Optional[asyncio.Task] = None
+# Per socket: (st_dev, st_ino) of the file it has read and the byte offset it has read up to.
+# Set from the socket's snapshot, so nothing appended after the snapshot is skipped.
+_socket_offsets: Dict[WebSocket, Tuple[Optional[Tuple[int, int]], int]] = {}
+
+
+def _last_line_end(f, size: int, block: int = 1 << 16) -> int:
+    """Offset just past the last newline in the first size bytes of f (0 if there is none)"""
+    pos = size
+    while pos > 0:
+        step = min(block, pos)
+        pos -= step
+        f.seek(pos)
+        i = f.read(step).rfind(b"\n")
+        if i >= 0:
+            return pos + i + 1
+    return 0
+
+
+def _log_snapshot(hours_back: int, limit: int):
+    """Newest entries for a new socket, plus the (file_id, offset) to tail from.
+
+    Both come from one fstat: the snapshot stops at the last complete line and the
+    watcher continues from exactly there, so no entry falls between the two.
+    """
+    try:
+        with open(analytics.log_file, 'rb') as f:
+            st = os.fstat(f.fileno())
+            end = _last_line_end(f, st.st_size)
+    except FileNotFoundError:
+        return [], (None, 0)
+    logs = _scan_logs(time.time() - hours_back * 3600, limit, end=end)
+    return logs, ((st.st_dev, st.st_ino), end)
+
+
+def _read_new_entries(path: str, offset: int, size: int):
+    """Parse the structured entries in bytes [offset, size); return (entries, next_offset).
+
+    Only complete lines are consumed, so a record that is still being written is
+    picked up on the next poll.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read(size - offset)
+    end = chunk.rfind(b"\n") + 1
+    entries = []
+    for m in MARKER_RE.finditer(chunk, 0, end):
+        try:
+            entries.append(json_utils.loads(m.group(1)))
+        except ValueError:
+            continue
+    return entries, offset + end
+
+
+def _drop_socket(ws: WebSocket) -> None:
+    if ws in active_connections:
+        active_connections.remove(ws)
+    _socket_offsets.pop(ws, None)
+
+
+async def _log_watcher():
+    """Poll the log file's size and fan newly appended entries out to all sockets"""
+    while active_connections:
+        try:
+            st = os.stat(analytics.log_file)
+        except FileNotFoundError:
+            st = None
+
+        if st is not None:
+            file_id = (st.st_dev, st.st_ino)
+            # Sockets are grouped by offset so each new range is read and parsed once
+            pending: Dict[int, List[WebSocket]] = {}
+            for ws in active_connections:
+                ws_file_id, offset = _socket_offsets.get(ws, (file_id, st.st_size))
+                if ws_file_id != file_id or st.st_size < offset:
+                    # Created, rotated or truncated since this socket last read: all of it is new
+                    offset = 0
+                _socket_offsets[ws] = (file_id, offset)
+                if st.st_size > offset:
+                    pending.setdefault(offset, []).append(ws)
+
+            for offset, sockets in pending.items():
+                entries, next_offset = await asyncio.to_thread(_read_new_entries, analytics.log_file, offset, st.st_size)
+                sockets = [ws for ws in sockets if ws in active_connections]
+                for ws in sockets:
+                    _socket_offsets[ws] = (file_id, next_offset)
+                if entries:
+                    entries.reverse()  # newest first, like /api/logs
+                    message = {
+                        "type": "log_update",
+                        "data": {"logs": entries[:_WS_MAX_PUSH], "total": len(entries)}
+                    }
+                    results = await asyncio.gather(*(ws.send_json(message) for ws in sockets), return_exceptions=True)
+                    for ws, result in zip(sockets, results):
+                        if isinstance(result, Exception):
+                            _drop_socket(ws)
+
+        await asyncio.sleep(_WATCH_INTERVAL_SECONDS)
+
+
 @app.websocket("/ws/logs")
 async def websocket_logs(websocket: WebSocket):
     """WebSocket endpoint for real-time log updates"""
+    global _watcher_task
     await websocket.accept()
-    active_connections.append(websocket)
     
     try:
-        while True:
-            # Send periodic updates
-            await asyncio.sleep(5)
-            
-            # Get latest logs
-            latest_logs = await get_logs(hours_back=1, limit=10)
-            
-            # Create a clean data structure for WebSocket
-            websocket_data = {
-                "logs": latest_logs.get("logs", []),
-                "total": latest_logs.get("total", 0)
+        # Initial snapshot for this client; the shared watcher continues from where it ends
+        latest_logs, offset = _log_snapshot(hours_back=1, limit=10)
+        await websocket.send_json({
+            "type": "log_update",
+            "data": {
+                "logs": latest_logs,
+                "total": len(latest_logs)
             }
-            
-            await websocket.send_json({
-                "type": "log_update",
-                "data": websocket_data
-            })
+        })
+
+        _socket_offsets[websocket] = offset
+        active_connections.append(websocket)
+        if _watcher_task is None or _watcher_task.done():
+            _watcher_task = asyncio.create_task(_log_watcher())
+
+        # Nothing is expected from the client; this only waits for the disconnect
+        while True:
+            await websocket.receive_text()
             
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        if websocket in active_connections:
-            active_connections.remove(websocket)
+    finally:
+        _drop_socket(websocket)
+
+# Size of each chunk written to the streamed CSV response
+_CSV_CHUNK_BYTES = 64 * 1024
+
+
+def _iter_csv(logs: List[Dict[str, Any]]):
+    """Yield CSV text for the given log entries in ~64 KB chunks"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["timestamp", "type", "session_id", "tokens", "data"])
+    for log in logs:
+        data = log.get('data', {})
+        writer.writerow([
+            datetime.fromtimestamp(log.get('timestamp', 0)).isoformat(),
+            log.get('type', ''),
+            data.get('session_id', ''),
+            log.get('tokens', 0),
+            json_utils.dumps(data)
+        ])
+        if buf.tell() >= _CSV_CHUNK_BYTES:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
 
 @app.get("/api/export/logs")
 async def export_logs(
     hours_back: int = Query(24, description="Hours to look back"),
-    format: str = Query("json", description="Export format: json or csv")
+    format: str = Query("json", description="Export format: json or csv"),
+    stream: bool = Query(False, description="Stream CSV as a text/csv download instead of a JSON envelope")
 ):
     """Export logs in various formats"""
     try:
-        logs_data = await get_logs(hours_back=hours_back, limit=10000)
+        logs_data = await get_logs(hours_back=hours_back, limit=10000, log_type=None, session_id=None)
         logs = logs_data["logs"]
         
         if format == "json":
@@ -228,26 +350,20 @@ async def export_logs(
                 "total_logs": len(logs)
             }
         elif format == "csv":
-            # Convert to CSV format
-            csv_lines = ["timestamp,type,session_id,tokens,data"]
-            
-            for log in logs:
-                timestamp = datetime.fromtimestamp(log.get('timestamp', 0)).isoformat()
-                log_type = log.get('type', '')
-                session_id = log.get('data', {}).get('session_id', '')
-                tokens = log.get('tokens', 0)
-                data_str = json.dumps(log.get('data', {}), ensure_ascii=False).replace('"', '""')
-                
-                csv_lines.append(f'"{timestamp}","{log_type}","{session_id}",{tokens},"{data_str}"')
-            
-            csv_content = "\n".join(csv_lines)
-            
-            return {
-                "content": csv_content,
-                "exported_at": datetime.now().isoformat(),
-                "total_logs": len(logs),
-                "format": "csv"
-            }
+            if not stream:
+                return {
+                    "content": "".join(_iter_csv(logs)),
+                    "exported_at": datetime.now().isoformat(),
+                    "total_logs": len(logs),
+                    "format": "csv"
+                }
+            # Stream the CSV in chunks; csv.writer handles quoting/escaping
+            filename = f"agent_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            return StreamingResponse(
+                _iter_csv(logs),
+                media_type="text/csv",
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            )
         else:
             raise HTTPException(status_code=400, detail="Unsupported format")
             
@@ -3,14 +3,29 @@ Runner configuration for MMVN Agent with Memory
 Ensures proper memory service integration
 """
 
+import asyncio
 import logging
+from collections import OrderedDict
+from typing import Dict, Set, Tuple
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from google.adk.memory import InMemoryMemoryService
-from memory_config import get_session_service, get_memory_service
+from app.memory_config import get_session_service, get_memory_service
 
 logger = logging.getLogger(__name__)
 
+# Memory writes run as background tasks; asyncio keeps only weak references to tasks,
+# so hold them here until they finish. Above the cap, writes run inline (backpressure).
+_MAX_PENDING_MEMORY_TASKS = 64
+_pending_memory_tasks: Set[asyncio.Task] = set()
+
+# Runners are reused per (agent, app_name); the services they wrap are process-wide singletons.
+# The cached Runner keeps its agent alive, so id(agent) cannot be reused while the entry exists.
+_runner_cache: Dict[Tuple[int, str], Runner] = {}
+
+# (app_name, user_id, session_id) already created in the session service, so
+# repeat turns skip the create_session round-trip. Least recently used entries are evicted past the cap.
+_MAX_KNOWN_SESSIONS = 4096
+_known_sessions: "OrderedDict[Tuple[str, str, str], None]" = OrderedDict()  # LRU order
+
 def create_memory_runner(agent, app_name: str = "mmvn_app"):
     """
     Create a Runner with proper memory service configuration.
@@ -46,7 +61,18 @@ def create_memory_runner(agent, app_name: str = "mmvn_app"):
             app_name=app_name
         )
 
-def add_session_to_memory(runner, user_id: str, session_id: str):
+def get_memory_runner(agent, app_name: str = "mmvn_app"):
+    """
+    Return the cached memory-enabled Runner for this agent and app, creating it on first use.
+    """
+    key = (id(agent), app_name)
+    runner = _runner_cache.get(key)
+    if runner is None:
+        # No await between lookup and insert: safe without a lock on the event loop
+        runner = _runner_cache[key] = create_memory_runner(agent, app_name)
+    return runner
+
+async def add_session_to_memory(runner, user_id: str, session_id: str):
     """
     Add a completed session to memory.
     This should be called when a session is complete.
@@ -58,19 +84,60 @@ def add_session_to_memory(runner, user_id: str, session_id: str):
     """
     try:
         # Get the completed session
-        completed_session = runner.session_service.get_session(
+        completed_session = await runner.session_service.get_session(
             app_name=runner.app_name,
             user_id=user_id,
             session_id=session_id
         )
+        if completed_session is None:
+            logger.warning(f"Session {session_id} not found; skipping memory update")
+            return
         
         # Add to memory
-        runner.memory_service.add_session_to_memory(completed_session)
+        await runner.memory_service.add_session_to_memory(completed_session)
         logger.info(f"Added session {session_id} to memory for user {user_id}")
         
     except Exception as e:
         logger.error(f"Error adding session to memory: {e}")
 
+async def schedule_add_session_to_memory(runner, user_id: str, session_id: str):
+    """
+    Add a session to memory without delaying the caller.
+    
+    The write runs as a background task; when too many writes are already
+    pending it is awaited inline instead, so the backlog stays bounded.
+    """
+    if len(_pending_memory_tasks) >= _MAX_PENDING_MEMORY_TASKS:
+        await add_session_to_memory(runner, user_id, session_id)
+        return
+    task = asyncio.create_task(add_session_to_memory(runner, user_id, session_id))
+    _pending_memory_tasks.add(task)
+    task.add_done_callback(_pending_memory_tasks.discard)
+
+async def _ensure_session(runner, app_name: str, user_id: str, session_id: str) -> bool:
+    """Create the session; True once it is known to exist (created now or already there)."""
+    try:
+        await runner.session_service.create_session(
+            app_name=app_name,
+            user_id=user_id,
+            session_id=session_id
+        )
+        return True
+    except Exception as e:
+        # Usually "already exists"; confirm before remembering the session
+        try:
+            existing = await runner.session_service.get_session(
+                app_name=app_name,
+                user_id=user_id,
+                session_id=session_id
+            )
+        except Exception:
+            existing = None
+        if existing is None:
+            logger.warning(f"Could not create session {session_id}: {e}")
+            return False
+        return True
+
 async def run_with_memory(agent, user_id: str, session_id: str, user_message, app_name: str = "mmvn_app"):
     """
     Run agent with automatic memory integration.
@@ -86,19 +153,17 @@ async def run_with_memory(agent, user_id: str, session_id: str, user_message, ap
         Agent response
     """
     try:
-        # Create memory-enabled runner
-        runner = create_memory_runner(agent, app_name)
+        # Reuse the memory-enabled runner for this agent/app
+        runner = get_memory_runner(agent, app_name)
         
-        # Create session if not exists
-        try:
-            await runner.session_service.create_session(
-                app_name=app_name,
-                user_id=user_id,
-                session_id=session_id
-            )
-        except:
-            # Session might already exist
-            pass
+        # Create session if not exists (only on the first turn seen for this session)
+        session_key = (app_name, user_id, session_id)
+        if session_key in _known_sessions:
+            _known_sessions.move_to_end(session_key)
+        elif await _ensure_session(runner, app_name, user_id, session_id):
+            _known_sessions[session_key] = None
+            if len(_known_sessions) > _MAX_KNOWN_SESSIONS:
+                _known_sessions.popitem(last=False)
         
         # Run the agent
         response = None
@@ -111,8 +176,8 @@ async def run_with_memory(agent, user_id: str, session_id: str, user_message, ap
                 response = event.content.parts[0].text
                 break
         
-        # Add session to memory after completion
-        add_session_to_memory(runner, user_id, session_id)
+        # Add session to memory after completion, off the response path
+        await schedule_add_session_to_memory(runner, user_id, session_id)
         
         return response
         
@@ -0,0 +1,99 @@
+"""
+Shared aiohttp sessions for the tool modules.
+One pooled ClientSession per module, bound to the event loop that created it.
+"""
+
+import asyncio
+import atexit
+import logging
+from typing import Callable, List, Optional, Set
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_shared_sessions: List["SharedSession"] = []
+# Close tasks scheduled for replaced sessions; asyncio keeps only weak references to tasks
+_closing_tasks: Set["asyncio.Task[None]"] = set()
+
+
+async def _close_quietly(session: aiohttp.ClientSession) -> None:
+    try:
+        await session.close()
+    except Exception as e:
+        logger.debug(f"Error closing replaced HTTP session: {e}")
+
+
+def _close_elsewhere(session: aiohttp.ClientSession, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Close a session from outside the loop that created it"""
+    if loop is not None and loop.is_running() and not loop.is_closed():
+        # Its loop is still serving another thread: close the session there
+        asyncio.run_coroutine_threadsafe(session.close(), loop)
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None:
+        # Its loop has stopped, so nothing is in flight on the session
+        task = running.create_task(_close_quietly(session))
+        _closing_tasks.add(task)
+        task.add_done_callback(_closing_tasks.discard)
+    elif loop is not None and not loop.is_closed():
+        loop.run_until_complete(_close_quietly(session))
+    else:
+        asyncio.run(_close_quietly(session))
+
+
+class SharedSession:
+    """Lazily created aiohttp.ClientSession, re-created when the running event loop changes.
+
+    A replaced session is closed rather than dropped. close_shared_sessions() closes every
+    session at shutdown; it also runs at interpreter exit as a fallback.
+    """
+
+    def __init__(self, make_connector: Callable[[], aiohttp.BaseConnector]):
+        self._make_connector = make_connector
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        _shared_sessions.append(self)
+
+    def get(self) -> aiohttp.ClientSession:
+        """Lấy session dùng chung, tạo mới nếu chưa có, đã đóng hoặc thuộc event loop khác."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._discard()
+            self._session = aiohttp.ClientSession(connector=self._make_connector())
+            self._loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        """Close the session; awaited when called from the loop that owns it."""
+        session = self._session
+        if session is not None and not session.closed and self._loop is asyncio.get_running_loop():
+            self._session = self._loop = None
+            await session.close()
+        else:
+            self._discard()
+
+    def _discard(self) -> None:
+        session, loop = self._session, self._loop
+        self._session = self._loop = None
+        if session is None or session.closed:
+            return
+        _close_elsewhere(session, loop)
+
+
+async def close_shared_sessions() -> None:
+    """Close every shared session (call from the server's shutdown hook)."""
+    for shared in _shared_sessions:
+        try:
+            await shared.close()
+        except Exception as e:
+            logger.warning(f"Error closing shared HTTP session: {e}")
+
+
+@atexit.register
+def _close_at_exit() -> None:
+    for shared in _shared_sessions:
+        shared._discard()
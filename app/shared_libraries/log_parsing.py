@@ -0,0 +1,78 @@
+"""
+Shared parsing helpers for the structured agent log (agent_interactions.log).
+Used by app.agent_analytics and app.log_api.
+"""
+
+import os
+import re
+from typing import Optional
+
+from app.shared_libraries import json_utils
+
+# Structured log lines look like "<asctime> - <logger> - <level> - MARKER: {json}".
+# One compiled pattern finds the marker and the JSON payload in a single scan.
+MARKER_RE = re.compile(rb"(?:AGENT_INTERACTION|TOOL_USAGE|TOOL_COMPLETION|TOOL_ERROR):[ \t]*(\{.*)")
+AGENT_INTERACTION_RE = re.compile(rb"AGENT_INTERACTION:[ \t]*(\{.*)")
+# Writers always emit "MARKER: {json}", so a 3-byte substring test rejects nearly all other
+# lines (framework logs, tracebacks) before the regex runs
+_MARKER_GATE = b": {"
+_MAX_MARKER_LEN = len(b"AGENT_INTERACTION")
+
+
+def match_marker(line: bytes):
+    """Return the MARKER_RE match for one log line, or None"""
+    i = line.find(_MARKER_GATE)
+    if i < 0:
+        return None
+    # The marker ends right before the gate: start the regex just ahead of it
+    return MARKER_RE.search(line, max(0, i - _MAX_MARKER_LEN))
+
+# Entries are appended in (nearly) timestamp order; threads can interleave slightly, so a
+# backward scan only stops once it is this far past the cutoff.
+CUTOFF_SLACK_SECONDS = 60
+
+
+def reverse_line_iter(path: str, block: int = 1 << 20, end: Optional[int] = None):
+    """Yield the lines of a file as bytes, last line first, reading fixed blocks from EOF
+    (or from byte offset end, when given)."""
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        if end is not None:
+            pos = min(pos, end)
+        tail = b""
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + tail).split(b"\n")
+            # The first piece may be the end of a line that started in an earlier block
+            tail = lines[0]
+            for line in reversed(lines[1:]):
+                if line:
+                    yield line
+        if tail:
+            yield tail
+
+
+def bisect_log_offset(buf, pattern: "re.Pattern[bytes]", ts: float) -> int:
+    """Offset of the first line whose entry is not older than ts.
+
+    Relies on entries being appended in time order, so only O(log n) entries are decoded.
+    """
+    lo, hi = 0, len(buf)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        m = pattern.search(buf, buf.rfind(b"\n", 0, mid) + 1)
+        entry_ts = None
+        while m is not None:
+            try:
+                entry_ts = json_utils.loads(m.group(1)).get('timestamp', 0)
+                break
+            except ValueError:
+                m = pattern.search(buf, m.end())
+        if entry_ts is None or entry_ts >= ts:
+            hi = mid
+        else:
+            # Everything up to the end of this (older) entry can be skipped
+            lo = max(mid + 1, m.end())
+    return buf.rfind(b"\n", 0, lo) + 1
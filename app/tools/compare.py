@@ -4,11 +4,12 @@ Fetches product details then emits unified product-display JSON
 Optimized for minimal token usage with ADK Context patterns.
 """
 
+import asyncio
 import logging
-import json
 import time
 from typing import List
 from google.adk.tools import ToolContext
+from app.shared_libraries import json_utils
 from .context_optimized_tools import context_optimizer
 
 logger = logging.getLogger(__name__)
@@ -27,70 +28,75 @@ def _safe_float(value, default=0.0):
 
 
 def _to_minimal_product(product: dict) -> dict:
-    images = product.get("media_gallery", []) or product.get("images", [])
+    get = product.get
+    images = get("media_gallery", []) or get("images", [])
     first_image = ""
     if isinstance(images, list) and images:
         first = images[0]
         first_image = first.get("url") if isinstance(first, dict) else first
-    price_info = product.get("price_info") or product.get("price", {})
-    current_price = (
-        price_info.get("final_price")
-        if isinstance(price_info, dict) and "final_price" in price_info
-        else price_info.get("current", 0) if isinstance(price_info, dict) else 0
-    )
-    original_price = (
-        price_info.get("regular_price") if isinstance(price_info, dict) else None
-    )
-    discount_percentage = 0
+
+    # Nested objects are looked up once; the type checks below run once per product
+    price_info = get("price_info") or get("price", {})
     if isinstance(price_info, dict):
+        current_price = price_info["final_price"] if "final_price" in price_info else price_info.get("current", 0)
+        original_price = price_info.get("regular_price")
         discount_percentage = price_info.get("discount_percentage", 0)
+    else:
+        current_price, original_price, discount_percentage = 0, None, 0
+
+    desc = get("description")
+    short = get("short_description")
+    if isinstance(short, str):
+        description = short or desc or ""
+    elif isinstance(desc, dict):
+        description = desc.get("html", "")
+    else:
+        description = get("description", "")
+
+    rating = get("rating_summary") or {}
 
     return {
-        "id": product.get("id", ""),
-        "sku": product.get("sku", ""),
-        "name": product.get("name", ""),
-        "brand": product.get("brand") or product.get("manufacturer", ""),
-        "category": product.get("category") or "",
+        "id": get("id", ""),
+        "sku": get("sku", ""),
+        "name": get("name", ""),
+        "brand": get("brand") or get("manufacturer", ""),
+        "category": get("category") or "",
         "price": {
             "current": current_price or 0,
             "original": original_price,
             "currency": "VND",
             "discount": f"{discount_percentage}%" if discount_percentage else None,
         },
-        "image": {"url": first_image},
-        "description": (
-            product.get("short_description")
-            or (product.get("description", {}) if isinstance(product.get("description"), dict) else product.get("description", ""))
-            or ""
-        ) if isinstance(product.get("short_description"), str) else (
-            (product.get("description", {}).get("html", "") if isinstance(product.get("description"), dict) else product.get("description", ""))
-        ),
-        "productUrl": product.get("product_url") or product.get("url") or "",
-        "availability": product.get("stock_status") or product.get("availability", "unknown"),
+        "imageUrl": first_image,
+        "description": description,
+        "productUrl": get("product_url") or get("url") or "",
+        "availability": get("stock_status") or get("availability", "unknown"),
         "rating": {
-            "average": (product.get("rating_summary") or {}).get("average", 0),
-            "count": (product.get("rating_summary") or {}).get("count", 0),
+            "average": rating.get("average", 0),
+            "count": rating.get("count", 0),
         },
-        "specs": product.get("specs") or {},
-        "colors": product.get("colors", []),
-        "storage_options": product.get("storage_options", []),
-        "promotions": product.get("promotions", {}),
+        "specs": get("specs") or {},
+        "colors": get("colors", []),
+        "storage_options": get("storage_options", []),
+        "promotions": get("promotions", {}),
     }
 
 
 async def compare_products(product_ids: List[str], tool_context: ToolContext) -> str:
     start_time = time.time()
+    t0 = time.perf_counter()  # monotonic clock for latency
     try:
-        # Log tool usage
-        log_entry = {
-            "timestamp": start_time,
-            "tool": "compare_products",
-            "input": {
-                "product_ids": product_ids,
-                "product_count": len(product_ids)
+        # Log tool usage (skip building/serializing the entry when INFO is off)
+        if logger.isEnabledFor(logging.INFO):
+            log_entry = {
+                "timestamp": start_time,
+                "tool": "compare_products",
+                "input": {
+                    "product_ids": product_ids,
+                    "product_count": len(product_ids)
+                }
             }
-        }
-        logger.info(f"TOOL_USAGE: {json.dumps(log_entry, ensure_ascii=False)}")
+            logger.info(f"TOOL_USAGE: {json_utils.dumps(log_entry)}")
         
         if len(product_ids) < 2:
             return "Cần ít nhất 2 sản phẩm để so sánh"
@@ -99,9 +105,16 @@ async def compare_products(product_ids: List[str], tool_context: ToolContext) ->
 
         from app.tools.cng.product_tools import get_product_detail as cng_get
 
+        # Fetch all products concurrently; results keep the order of product_ids
+        results = await asyncio.gather(
+            *(cng_get(product_id=pid, tool_context=tool_context) for pid in product_ids),
+            return_exceptions=True
+        )
         products_full = []
-        for pid in product_ids:
-            result = await cng_get(product_id=pid, tool_context=tool_context)
+        for pid, result in zip(product_ids, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Compare: failed to fetch product {pid}: {result}")
+                continue
             if result.get("status") == "success" and result.get("product"):
                 products_full.append(result["product"]) 
 
@@ -119,16 +132,17 @@ async def compare_products(product_ids: List[str], tool_context: ToolContext) ->
         json_response = context_optimizer.optimize_compare_response(compare_data, f"compare {len(product_ids)} products")
 
         # Log tool completion
-        end_time = time.time()
-        log_entry = {
-            "timestamp": end_time,
-            "tool": "compare_products",
-            "output": {
-                "products_compared": len(products_full),
-                "processing_time": end_time - start_time
+        if logger.isEnabledFor(logging.INFO):
+            end_time = time.time()
+            log_entry = {
+                "timestamp": end_time,
+                "tool": "compare_products",
+                "output": {
+                    "products_compared": len(products_full),
+                    "processing_time": time.perf_counter() - t0
+                }
             }
-        }
-        logger.info(f"TOOL_COMPLETION: {json.dumps(log_entry, ensure_ascii=False)}")
+            logger.info(f"TOOL_COMPLETION: {json_utils.dumps(log_entry)}")
         
         return json_response
     except Exception as e:
@@ -140,9 +154,9 @@ async def compare_products(product_ids: List[str], tool_context: ToolContext) ->
             "timestamp": end_time,
             "tool": "compare_products",
             "error": str(e),
-            "processing_time": end_time - start_time
+            "processing_time": time.perf_counter() - t0
         }
-        logger.error(f"TOOL_ERROR: {json.dumps(log_entry, ensure_ascii=False)}")
+        logger.error(f"TOOL_ERROR: {json_utils.dumps(log_entry)}")
         
         return f"Lỗi khi so sánh sản phẩm: {str(e)}"
 
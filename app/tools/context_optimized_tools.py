@@ -3,20 +3,89 @@ Context-Optimized Tools - Tối ưu hóa tool outputs theo ADK Context patterns
 Dựa trên: https://google.github.io/adk-docs/context/#accessing-information
 """
 
+import heapq
 import logging
-import json
-import time
-from typing import Dict, Any, Optional, List
+import os
+from itertools import accumulate
+from operator import itemgetter
+from typing import Dict, Any, Optional, List, Set, Tuple
 from google.genai import types as genai_types
-from google.adk.tools import ToolContext
+from app.shared_libraries import json_utils
 
 logger = logging.getLogger(__name__)
 
+# Approximate characters per token; integer so estimates stay ints end to end
+_ESTIMATE_DIVISOR = 4
+
 def estimate_tokens(text: str) -> int:
     """Estimate token count for text (optimized for Vietnamese)"""
     if not text:
         return 0
-    return max(1, len(text) // 3.7)
+    return max(1, len(text) // _ESTIMATE_DIVISOR)
+
+# Characters that force a TOON cell to be quoted (JSON string escaping)
+_TOON_QUOTE_CHARS = frozenset(',"\\:\n\r\t')
+
+def _toon_scalar(value: Any) -> str:
+    """Render one scalar as a TOON cell."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    text = str(value)
+    if not text or text != text.strip() or not _TOON_QUOTE_CHARS.isdisjoint(text):
+        return json_utils.dumps(text)
+    # Strings that would read back as numbers/literals are quoted to keep their type
+    if text in ("true", "false", "null") or (text[0] in "-0123456789" and _looks_numeric(text)):
+        return json_utils.dumps(text)
+    return text
+
+def _looks_numeric(text: str) -> bool:
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+def _to_toon(name: str, rows: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Render a uniform list of dicts as a TOON table: `name[N]{a,b.c}:` + one row per item.
+
+    Nested dicts are flattened one level into dotted columns. The header is the union of
+    the fields of every row; returns None when a row lacks one of them (or holds an empty
+    dict, a list or deeper nesting), and callers fall back to JSON.
+    """
+    if not rows:
+        return None
+    # dict as an insertion-ordered set: columns in first-seen order across all rows
+    columns: Dict[Tuple[str, Optional[str]], None] = {}
+    for row in rows:
+        for key, value in row.items():
+            if isinstance(value, dict):
+                if not value:
+                    return None
+                columns.update(((key, sub), None) for sub in value)
+            else:
+                columns[(key, None)] = None
+
+    lines = [f"{name}[{len(rows)}]{{{','.join(k if sub is None else f'{k}.{sub}' for k, sub in columns)}}}:"]
+    for row in rows:
+        cells = []
+        for key, sub in columns:
+            if key not in row:
+                return None
+            value = row[key]
+            if sub is not None:
+                if not isinstance(value, dict) or sub not in value:
+                    return None
+                value = value[sub]
+            if isinstance(value, (dict, list)):
+                return None
+            cells.append(_toon_scalar(value))
+        lines.append("  " + ",".join(cells))
+    return "\n".join(lines)
 
 class ContextOptimizedToolWrapper:
     """
@@ -29,8 +98,34 @@ class ContextOptimizedToolWrapper:
     4. Smart summarization
     """
     
-    def __init__(self, max_output_tokens: int = 500):
+    def __init__(self, max_output_tokens: int = 500, use_toon: bool = False):
         self.max_output_tokens = max_output_tokens
+        # Emit product lists as TOON tables (key names once per list) instead of JSON
+        # arrays. Off by default: the frontend renders the product-display JSON as-is.
+        self.use_toon = use_toon
+
+    def _encode_response(self, response: Dict[str, Any]) -> str:
+        """Serialize a product response: TOON when enabled and the product list is uniform, else JSON."""
+        if not self.use_toon:
+            return json_utils.dumps(response)
+        lines = []
+        for key, value in response.items():
+            if key == "products":
+                table = _to_toon(key, value)
+                if table is None:
+                    return json_utils.dumps(response)
+                lines.append(table)
+            elif isinstance(value, dict):
+                lines.append(f"{key}:")
+                for sub, sub_value in value.items():
+                    if isinstance(sub_value, (dict, list)):
+                        return json_utils.dumps(response)
+                    lines.append(f"  {sub}: {_toon_scalar(sub_value)}")
+            elif isinstance(value, list):
+                return json_utils.dumps(response)
+            else:
+                lines.append(f"{key}: {_toon_scalar(value)}")
+        return "\n".join(lines)
 
     # --------------------------- Context filtering (pre-LLM) ---------------------------
     def filter_llm_request_contents(
@@ -50,8 +145,8 @@ class ContextOptimizedToolWrapper:
         - Truncate very long text parts to max_part_chars
         """
         logger.info(
-            f"[ContextFilter] start contents={len(contents)} keep={num_invocations_to_keep} "
-            f"budget={token_budget} max_part_chars={max_part_chars}"
+            "[ContextFilter] start contents=%d keep=%d budget=%d max_part_chars=%d",
+            len(contents), num_invocations_to_keep, token_budget, max_part_chars
         )
         if not contents:
             return contents
@@ -71,45 +166,44 @@ class ContextOptimizedToolWrapper:
         kept_invocations = invocations[-num_invocations_to_keep:] if num_invocations_to_keep > 0 else invocations
         kept: List[genai_types.Content] = [c for inv in kept_invocations for c in inv]
         logger.info(
-            f"[ContextFilter] invocations total={len(invocations)} kept={len(kept_invocations)} flat_contents={len(kept)}"
+            "[ContextFilter] invocations total=%d kept=%d flat_contents=%d",
+            len(invocations), len(kept_invocations), len(kept)
         )
 
         # 2) Drop non-text parts and truncate long parts
         def _shrink_content(c: genai_types.Content) -> genai_types.Content:
-            new_parts: List[genai_types.Part] = []
-            for p in c.parts or []:
-                txt = getattr(p, 'text', None)
-                if txt is None:
-                    # skip non-text parts to reduce context size
-                    continue
-                if len(txt) > max_part_chars:
-                    txt = txt[:max_part_chars] + '…'
-                new_parts.append(genai_types.Part(text=txt))
+            # Non-text parts are skipped to reduce context size; text is read once per part
+            new_parts: List[genai_types.Part] = [
+                genai_types.Part(text=txt if len(txt) <= max_part_chars else txt[:max_part_chars] + '…')
+                for p in c.parts or []
+                if (txt := getattr(p, 'text', None)) is not None
+            ]
             return genai_types.Content(role=c.role, parts=new_parts)
 
         shrunk = [_shrink_content(c) for c in kept]
-        shrunk_parts = sum(len(c.parts or []) for c in shrunk)
-        logger.info(f"[ContextFilter] after shrink: contents={len(shrunk)} parts={shrunk_parts}")
-
-        # 3) Enforce token budget (rough estimate)
-        def _contents_tokens(cs: List[genai_types.Content]) -> int:
-            total = 0
-            for c in cs:
-                for p in c.parts or []:
-                    if p.text:
-                        total += estimate_tokens(p.text)
-            return total
+        if logger.isEnabledFor(logging.INFO):
+            shrunk_parts = sum(len(c.parts or []) for c in shrunk)
+            logger.info("[ContextFilter] after shrink: contents=%d parts=%d", len(shrunk), shrunk_parts)
 
-        total_tokens = _contents_tokens(shrunk)
+        # 3) Enforce token budget (rough estimate); count each content once
+        token_counts = [
+            sum(estimate_tokens(p.text) for p in c.parts or [] if p.text)
+            for c in shrunk
+        ]
+        total_tokens = sum(token_counts)
         if total_tokens <= token_budget:
-            logger.info(f"[ContextFilter] kept={len(shrunk)} contents, tokens≈{total_tokens}")
+            logger.info("[ContextFilter] kept=%d contents, tokens≈%d", len(shrunk), total_tokens)
             return shrunk
 
-        # Remove from the oldest side until within budget
-        pruned = list(shrunk)
-        while pruned and _contents_tokens(pruned) > token_budget:
-            pruned.pop(0)
-        logger.info(f"[ContextFilter] pruned to {len(pruned)} contents, tokens≈{_contents_tokens(pruned)}")
+        # Remove from the oldest side until within budget: find the cut point on the
+        # prefix sums of dropped tokens, then slice once
+        cut, dropped_tokens = 0, 0
+        for cut, dropped_tokens in enumerate(accumulate(token_counts), 1):
+            if total_tokens - dropped_tokens <= token_budget:
+                break
+        pruned = shrunk[cut:]
+        total_tokens -= dropped_tokens
+        logger.info("[ContextFilter] pruned to %d contents, tokens≈%d", len(pruned), total_tokens)
         return pruned
     
     def optimize_search_response(self, search_data: Dict[str, Any], user_query: str) -> str:
@@ -123,10 +217,10 @@ class ContextOptimizedToolWrapper:
             
             # Create ultra-minimal response
             if not products:
-                return json.dumps({
+                return json_utils.dumps({
                     "type": "no-results",
                     "message": f"Không tìm thấy sản phẩm phù hợp với '{user_query}'"
-                }, ensure_ascii=False)
+                })
             
             # Select essential products (max 10 for better user experience)
             essential_products = self._select_essential_products(products, user_query, max_products=10)
@@ -144,23 +238,23 @@ class ContextOptimizedToolWrapper:
             }
             
             # Convert to JSON and check token count
-            json_response = json.dumps(response, ensure_ascii=False)
+            json_response = json_utils.dumps(response)
             token_count = estimate_tokens(json_response)
             
             # If still too large, further reduce
             if token_count > self.max_output_tokens:
                 response = self._further_reduce_response(response, user_query)
-                json_response = json.dumps(response, ensure_ascii=False)
+                json_response = json_utils.dumps(response)
             
-            logger.info(f"Search response optimized: {token_count} tokens")
-            return json_response
+            logger.info("Search response optimized: %d tokens", token_count)
+            return self._encode_response(response) if self.use_toon else json_response
             
         except Exception as e:
-            logger.error(f"Error optimizing search response: {e}")
-            return json.dumps({
+            logger.error("Error optimizing search response: %s", e)
+            return json_utils.dumps({
                 "type": "error",
                 "message": f"Lỗi khi tìm kiếm: {str(e)}"
-            }, ensure_ascii=False)
+            })
     
     def _select_essential_products(self, products: List[Dict[str, Any]], user_query: str, max_products: int = 6) -> List[Dict[str, Any]]:
         """
@@ -169,32 +263,36 @@ class ContextOptimizedToolWrapper:
         if not products:
             return []
         
-        # Score products by relevance
+        # Score products by relevance; the query is normalized once for all products
+        query_lower = (user_query or "").lower()
+        query_words = set(query_lower.split())
         scored_products = []
         for product in products:
-            score = self._calculate_product_relevance(product, user_query)
+            score = self._calculate_product_relevance(product, query_lower, query_words)
             scored_products.append((product, score))
         
-        # Sort by relevance (highest first)
-        scored_products.sort(key=lambda x: x[1], reverse=True)
+        # Take the top products by relevance (highest first); same order as a stable
+        # descending sort, without sorting the whole list
+        top_products = heapq.nlargest(max_products, scored_products, key=itemgetter(1))
         
-        # Select top products and convert to minimal format
+        # Convert top products to minimal format
         essential_products = []
-        for product, score in scored_products[:max_products]:
+        for product, score in top_products:
             minimal_product = self._create_minimal_product(product)
             essential_products.append(minimal_product)
         
         return essential_products
     
-    def _calculate_product_relevance(self, product: Dict[str, Any], user_query: str) -> float:
+    def _calculate_product_relevance(self, product: Dict[str, Any], query_lower: str, query_words: Set[str]) -> float:
         """
         Calculate relevance score for product based on user query.
+
+        query_lower/query_words are the lowercased query and its words, computed once by the caller.
         """
-        if not product or not user_query:
+        if not product or not query_lower:
             return 0.0
         
         score = 0.0
-        query_lower = user_query.lower()
         
         # Check product name
         product_name = product.get("name", "").lower()
@@ -203,12 +301,12 @@ class ContextOptimizedToolWrapper:
             if query_lower in product_name:
                 score += 1.0
             # Word match gets medium score
-            elif any(word in product_name for word in query_lower.split()):
+            elif any(word in product_name for word in query_words):
                 score += 0.5
         
         # Check category
         category = product.get("category", "").lower()
-        if category and any(word in category for word in query_lower.split()):
+        if category and any(word in category for word in query_words):
             score += 0.3
         
         # Check SKU
@@ -229,7 +327,7 @@ class ContextOptimizedToolWrapper:
                 "current": product.get("price", {}).get("current", 0),
                 "currency": "VND"
             },
-            "image": {"url": product.get("image", {}).get("url", "")},
+            "imageUrl": product.get("imageUrl", ""),
             "productUrl": product.get("productUrl", ""),
             "category": product.get("category", "")
         }
@@ -247,8 +345,8 @@ class ContextOptimizedToolWrapper:
         for product in response.get("products", []):
             if "category" in product:
                 del product["category"]
-            if "image" in product and not product["image"].get("url"):
-                del product["image"]
+            if "imageUrl" in product and not product["imageUrl"]:
+                del product["imageUrl"]
         
         return response
     
@@ -260,10 +358,10 @@ class ContextOptimizedToolWrapper:
             products = compare_data.get("products", [])
             
             if not products:
-                return json.dumps({
+                return json_utils.dumps({
                     "type": "no-results",
                     "message": "Không có sản phẩm để so sánh"
-                }, ensure_ascii=False)
+                })
             
             # Create minimal comparison
             minimal_products = []
@@ -277,16 +375,17 @@ class ContextOptimizedToolWrapper:
                 "products": minimal_products
             }
             
-            json_response = json.dumps(response, ensure_ascii=False)
-            logger.info(f"Compare response optimized: {estimate_tokens(json_response)} tokens")
+            json_response = self._encode_response(response)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Compare response optimized: %d tokens", estimate_tokens(json_response))
             return json_response
             
         except Exception as e:
-            logger.error(f"Error optimizing compare response: {e}")
-            return json.dumps({
+            logger.error("Error optimizing compare response: %s", e)
+            return json_utils.dumps({
                 "type": "error",
                 "message": f"Lỗi khi so sánh: {str(e)}"
-            }, ensure_ascii=False)
+            })
     
     def optimize_explore_response(self, explore_data: Dict[str, Any], user_query: str) -> str:
         """
@@ -296,10 +395,10 @@ class ContextOptimizedToolWrapper:
             categories = explore_data.get("categories", [])
             
             if not categories:
-                return json.dumps({
+                return json_utils.dumps({
                     "type": "no-results",
                     "message": "Không tìm thấy danh mục nào"
-                }, ensure_ascii=False)
+                })
             
             # Create minimal category list
             minimal_categories = []
@@ -315,16 +414,21 @@ class ContextOptimizedToolWrapper:
                 "categories": minimal_categories
             }
             
-            json_response = json.dumps(response, ensure_ascii=False)
-            logger.info(f"Explore response optimized: {estimate_tokens(json_response)} tokens")
+            json_response = json_utils.dumps(response)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Explore response optimized: %d tokens", estimate_tokens(json_response))
             return json_response
             
         except Exception as e:
-            logger.error(f"Error optimizing explore response: {e}")
-            return json.dumps({
+            logger.error("Error optimizing explore response: %s", e)
+            return json_utils.dumps({
                 "type": "error",
                 "message": f"Lỗi khi khám phá: {str(e)}"
-            }, ensure_ascii=False)
+            })
+
+# TOON product tables are for LLM-only clients; the web frontend parses the
+# product-display JSON, so leave this off when it is in use.
+_USE_TOON = os.getenv("MMVN_TOOL_OUTPUT_TOON", "").lower() in ("1", "true", "yes")
 
 # Global instance
-context_optimizer = ContextOptimizedToolWrapper(max_output_tokens=500)
+context_optimizer = ContextOptimizedToolWrapper(max_output_tokens=500, use_toon=_USE_TOON)
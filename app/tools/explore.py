@@ -2,130 +2,225 @@
 Simple Explore Tool for MMVN - direct GraphQL to online.mmvietnam.com
 """
 
+import asyncio
+import functools
 import logging
-import json
+import os
 import time
-from typing import Dict, Any, List
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from google.adk.tools import ToolContext
+from app.shared_libraries import json_utils
+from app.shared_libraries.http_session import SharedSession
 import aiohttp
-import urllib.parse
 
 logger = logging.getLogger(__name__)
 
 GRAPHQL_ENDPOINT = "https://online.mmvietnam.com/graphql"
 DEFAULT_STORE = "b2c_10010_vi"
 
+# Product fields requested by every explore query
+_FIELDS = (
+    "id sku name url_key url_suffix url_path "
+    "price { regularPrice { amount { currency value } } } "
+    "price_range { maximum_price { final_price { currency value } discount { percent_off } } } "
+    "small_image { url } unit_ecom description { html }"
+)
 
-def _build_product_url(product: Dict[str, Any]) -> str:
-    if product.get("url_key") and product.get("url_suffix"):
-        return f"https://online.mmvietnam.com/product/{product['url_key']}{product['url_suffix']}"
-    if product.get("url_key"):
-        return f"https://online.mmvietnam.com/product/{product['url_key']}.html"
-    if product.get("url_path"):
-        return f"https://online.mmvietnam.com{product['url_path']}"
+# Constant query text; SKUs and page size travel as variables, so nothing is quoted client-side
+_GQL_PRODUCTS_BY_SKU = (
+    "query ($skus: [String], $pageSize: Int) { "
+    "products(filter: { sku: { in: $skus } }, pageSize: $pageSize, currentPage: 1) { items { "
+    + _FIELDS + " } } }"
+)
+
+
+# Shared HTTP session so lookups reuse pooled keep-alive connections (no TLS handshake per call)
+_http_session = SharedSession(lambda: aiohttp.TCPConnector(limit=50, ttl_dns_cache=300, keepalive_timeout=60))
+
+
+def _get_http_session() -> aiohttp.ClientSession:
+    """Lấy session dùng chung, tạo mới nếu chưa có, đã đóng hoặc thuộc event loop khác."""
+    return _http_session.get()
+
+
+_SITE_URL = "https://online.mmvietnam.com"
+_PRODUCT_URL_PREFIX = _SITE_URL + "/product/"
+
+
+@functools.lru_cache(maxsize=4096)
+def _product_url(url_key: Optional[str], url_suffix: Optional[str], url_path: Optional[str]) -> str:
+    if url_key and url_suffix:
+        return f"{_PRODUCT_URL_PREFIX}{url_key}{url_suffix}"
+    if url_key:
+        return f"{_PRODUCT_URL_PREFIX}{url_key}.html"
+    if url_path:
+        return f"{_SITE_URL}{url_path}"
     return ""
 
 
+def _build_product_url(product: Dict[str, Any]) -> str:
+    # Product URLs repeat across lookups; memoize on the three URL fields
+    return _product_url(product.get("url_key"), product.get("url_suffix"), product.get("url_path"))
+
+
+# Field paths into the GraphQL product item, resolved by _pluck
+_MAX_PRICE_PATH = ("price_range", "maximum_price")
+_FINAL_PRICE_PATH = ("final_price", "value")
+_PERCENT_OFF_PATH = ("discount", "percent_off")
+_REGULAR_PRICE_PATH = ("price", "regularPrice", "amount", "value")
+_IMAGE_URL_PATH = ("small_image", "url")
+
+
+def _pluck(obj: Any, path: Tuple[str, ...]) -> Any:
+    """Walk nested dicts along path; None as soon as a step is missing or not a dict."""
+    for key in path:
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+    return obj
+
+
 def _to_minimal_product(product: Dict[str, Any]) -> Dict[str, Any]:
-    image_url = product.get("small_image", {}).get("url", "") if isinstance(product.get("small_image"), dict) else ""
-    current_price = 0
-    original_price = None
+    get = product.get
+    image_url = _pluck(product, _IMAGE_URL_PATH) or ""
+    max_price = _pluck(product, _MAX_PRICE_PATH)
+    current_price = _pluck(max_price, _FINAL_PRICE_PATH)
+    original_price = _pluck(product, _REGULAR_PRICE_PATH)
+    percent_off = _pluck(max_price, _PERCENT_OFF_PATH)
     discount_percentage = None
-    try:
-        max_price = product.get("price_range", {}).get("maximum_price", {})
-        final_price = max_price.get("final_price", {})
-        current_price = final_price.get("value", 0)
-        regular_amount = product.get("price", {}).get("regularPrice", {}).get("amount", {})
-        original_price = regular_amount.get("value")
-        percent_off = max_price.get("discount", {}).get("percent_off")
-        if isinstance(percent_off, (int, float)) and percent_off > 0:
-            discount_percentage = f"{round(percent_off)}%"
-    except Exception:
-        pass
-
-    description = ""
-    if isinstance(product.get("description"), dict):
-        description = product.get("description", {}).get("html", "")
-    elif isinstance(product.get("description"), str):
-        description = product.get("description", "")
+    if isinstance(percent_off, (int, float)) and percent_off > 0:
+        discount_percentage = f"{round(percent_off)}%"
+
+    description = get("description")
+    if isinstance(description, dict):
+        description = description.get("html", "")
+    elif not isinstance(description, str):
+        description = ""
 
     minimal: Dict[str, Any] = {
-        "id": product.get("id", ""),
-        "sku": product.get("sku", ""),
-        "name": product.get("name", ""),
+        "id": get("id", ""),
+        "sku": get("sku", ""),
+        "name": get("name", ""),
         "price": {
             "current": current_price or 0,
             "original": original_price,
             "currency": "VND",
             "discount": discount_percentage,
         },
-        "image": {"url": image_url},
+        "imageUrl": image_url,
         "description": description,
         "productUrl": _build_product_url(product),
     }
-    if product.get("unit_ecom"):
-        minimal["unit"] = product.get("unit_ecom")
+    unit = get("unit_ecom")
+    if unit:
+        minimal["unit"] = unit
     return minimal
 
 
-async def _graphql_get(session: aiohttp.ClientSession, query: str) -> Dict[str, Any]:
-    params = {"query": query}
-    url = GRAPHQL_ENDPOINT + "?" + urllib.parse.urlencode(params)
+async def _graphql_post(session: aiohttp.ClientSession, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+    payload = {"query": query, "variables": variables}
     headers = {"Store": DEFAULT_STORE}
-    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=20)) as resp:
+    async with session.post(GRAPHQL_ENDPOINT, json=payload, headers=headers, timeout=aiohttp.ClientTimeout(total=20)) as resp:
         resp.raise_for_status()
         return await resp.json()
 
 
+# Recently fetched GraphQL items keyed by SKU (LRU + TTL), so repeat lookups skip the network
+_ITEM_CACHE_MAXSIZE = 2048
+_ITEM_CACHE_TTL_SECONDS = 300
+_item_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+
+def _cache_get(sku: str) -> Optional[Dict[str, Any]]:
+    entry = _item_cache.get(sku)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        del _item_cache[sku]
+        return None
+    _item_cache.move_to_end(sku)
+    return entry[1]
+
+
+def _cache_put(item: Dict[str, Any]) -> None:
+    sku = item.get("sku")
+    if not sku:
+        return
+    _item_cache[sku] = (time.monotonic() + _ITEM_CACHE_TTL_SECONDS, item)
+    _item_cache.move_to_end(sku)
+    if len(_item_cache) > _ITEM_CACHE_MAXSIZE:
+        _item_cache.popitem(last=False)
+
+
+# SKUs per GraphQL request. The default sends one IN query per call (explore_product takes
+# at most 12 SKUs); lower it to fan a list out into concurrent smaller queries instead.
+_SKU_BATCH_SIZE = max(1, int(os.getenv("MMVN_EXPLORE_SKU_BATCH", "12")))
+_FETCH_CONCURRENCY = 8
+
+
+async def _fetch_batch(sku_list: List[str], sem: asyncio.Semaphore) -> List[Dict[str, Any]]:
+    variables = {"skus": sku_list, "pageSize": max(1, len(sku_list))}
+    async with sem:
+        data = await _graphql_post(_get_http_session(), _GQL_PRODUCTS_BY_SKU, variables)
+    items = data.get("data", {}).get("products", {}).get("items", [])
+    for item in items:
+        _cache_put(item)
+    return items
+
+
+async def _fetch_items(sku_list: List[str]) -> List[Dict[str, Any]]:
+    """Query GraphQL for the given SKUs; batches of _SKU_BATCH_SIZE run concurrently."""
+    sem = asyncio.Semaphore(_FETCH_CONCURRENCY)
+    if len(sku_list) <= _SKU_BATCH_SIZE:
+        return await _fetch_batch(sku_list, sem)
+    batches = [sku_list[i:i + _SKU_BATCH_SIZE] for i in range(0, len(sku_list), _SKU_BATCH_SIZE)]
+    results = await asyncio.gather(*(_fetch_batch(batch, sem) for batch in batches))
+    return [item for items in results for item in items]
+
+
 async def explore_product(product_id: str, tool_context: ToolContext) -> str:
     start_time = time.time()
+    t0 = time.perf_counter()  # monotonic clock for latency
     try:
-        # Log tool usage
-        log_entry = {
-            "timestamp": start_time,
-            "tool": "explore_product",
-            "input": {
-                "product_id": product_id
+        # Log tool usage (skip building/serializing the entry when INFO is off)
+        if logger.isEnabledFor(logging.INFO):
+            log_entry = {
+                "timestamp": start_time,
+                "tool": "explore_product",
+                "input": {
+                    "product_id": product_id
+                }
             }
-        }
-        logger.info(f"TOOL_USAGE: {json.dumps(log_entry, ensure_ascii=False)}")
+            logger.info(f"TOOL_USAGE: {json_utils.dumps(log_entry)}")
         
         # Support multiple SKUs separated by comma/space; fallback to single
         raw = (product_id or "").strip()
         sku_list: List[str] = [s.strip() for s in raw.replace("\n", ",").replace(";", ",").split(",") if s.strip()]
         sku_list = sku_list[:12] if sku_list else []
 
-        if len(sku_list) <= 1:
-            safe_id = (sku_list[0] if sku_list else raw).replace('"', '\\"')
-            gql = (
-                "query { products(filter: { sku: { eq: \"%s\" } }, pageSize: 1, currentPage: 1) { items { "
-                "id sku name url_key url_suffix url_path "
-                "price { regularPrice { amount { currency value } } } "
-                "price_range { maximum_price { final_price { currency value } discount { percent_off } } } "
-                "small_image { url } unit_ecom description { html } } } }"
-            ) % safe_id
-        else:
-            # Batch fetch with IN filter
-            # Quote each SKU safely for GraphQL IN list
-            safe_list = ", ".join([json.dumps(s) for s in sku_list])
-            gql = (
-                "query { products(filter: { sku: { in: [%s] } }, pageSize: %d, currentPage: 1) { items { "
-                "id sku name url_key url_suffix url_path "
-                "price { regularPrice { amount { currency value } } } "
-                "price_range { maximum_price { final_price { currency value } discount { percent_off } } } "
-                "small_image { url } unit_ecom description { html } } } }"
-            ) % (safe_list, max(1, len(sku_list)))
-
-        async with aiohttp.ClientSession() as session:
-            data = await _graphql_get(session, gql)
-
-        items = data.get("data", {}).get("products", {}).get("items", [])
+        # Serve SKUs seen recently from the item cache; query only the rest
+        requested = list(dict.fromkeys(sku_list)) or [raw]
+        by_sku: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        for sku in requested:
+            item = _cache_get(sku)
+            if item is None:
+                missing.append(sku)
+            else:
+                by_sku[sku] = item
+        fetched = await _fetch_items(missing) if missing else []
+        for item in fetched:
+            by_sku.setdefault(item.get("sku"), item)
+        items = [by_sku[sku] for sku in requested if sku in by_sku]
+        requested_set = set(requested)
+        items.extend(item for item in fetched if item.get("sku") not in requested_set)
         if not items:
-            return json.dumps({
+            return json_utils.dumps({
                 "type": "product-display",
                 "message": "Không tìm thấy sản phẩm theo yêu cầu",
                 "products": []
-            }, ensure_ascii=False)
+            })
 
         minimals = [_to_minimal_product(p) for p in items]
         json_response = {
@@ -134,19 +229,20 @@ async def explore_product(product_id: str, tool_context: ToolContext) -> str:
             "products": minimals,
         }
         # Log tool completion
-        end_time = time.time()
-        log_entry = {
-            "timestamp": end_time,
-            "tool": "explore_product",
-            "output": {
-                "product_found": bool(items),
-                "count": len(items),
-                "processing_time": end_time - start_time
+        if logger.isEnabledFor(logging.INFO):
+            end_time = time.time()
+            log_entry = {
+                "timestamp": end_time,
+                "tool": "explore_product",
+                "output": {
+                    "product_found": bool(items),
+                    "count": len(items),
+                    "processing_time": time.perf_counter() - t0
+                }
             }
-        }
-        logger.info(f"TOOL_COMPLETION: {json.dumps(log_entry, ensure_ascii=False)}")
+            logger.info(f"TOOL_COMPLETION: {json_utils.dumps(log_entry)}")
         
-        return json.dumps(json_response, ensure_ascii=False)
+        return json_utils.dumps(json_response)
     except Exception as e:
         end_time = time.time()
         logger.exception("Explore error")
@@ -156,9 +252,9 @@ async def explore_product(product_id: str, tool_context: ToolContext) -> str:
             "timestamp": end_time,
             "tool": "explore_product",
             "error": str(e),
-            "processing_time": end_time - start_time
+            "processing_time": time.perf_counter() - t0
         }
-        logger.error(f"TOOL_ERROR: {json.dumps(log_entry, ensure_ascii=False)}")
+        logger.error(f"TOOL_ERROR: {json_utils.dumps(log_entry)}")
         
         return f"Lỗi khi lấy thông tin sản phẩm: {str(e)}"
 
@@ -8,13 +8,24 @@ Mở rộng theo chính sách ADK-aligned trong memory-tasklog.md:
 - Redact PII trước khi persist
 """
 
-import json
+import atexit
+import functools
+import os
+import queue
 import re
+import sys
+import threading
 import time
 import logging
+from collections import OrderedDict, deque
 from typing import Dict, Any, Optional, List
 from google.adk.tools import ToolContext
-from google.adk.agents.callback_context import CallbackContext
+from app.shared_libraries import json_utils
+
+try:
+    import re2  # google-re2: linear-time matching, optional
+except ImportError:
+    re2 = None
 
 logger = logging.getLogger(__name__)
 
@@ -24,27 +35,100 @@ PII_PATTERNS = [
     re.compile(r"\b\+?\d[\d .-]{7,}\b"),
 ]
 
+# All PII patterns as one alternation, so redact() scans the text once.
+# Compiled with RE2 when installed (linear time, no catastrophic backtracking).
+_PII_RE = (re2 or re).compile("|".join(f"(?:{pat.pattern})" for pat in PII_PATTERNS))
+# An email needs an "@"; a phone needs a digit followed by 7+ digits/separators.
+# Texts with neither (most chat turns, prices like "50000 đồng") skip the full regex.
+_PHONE_CANDIDATE = re.compile(r"\d[\d .-]{7}").search
+
 def redact(text: Optional[str]) -> Optional[str]:
     """Mask common PII before persisting."""
     if not text:
         return text
-    redacted = text
-    for pat in PII_PATTERNS:
-        redacted = pat.sub("[REDACTED]", redacted)
-    return redacted
+    if "@" not in text and not _PHONE_CANDIDATE(text):
+        return text
+    # Not memoized: a cache keyed on the raw text would keep the unredacted PII in memory
+    return _PII_RE.sub("[REDACTED]", text)
 
 # --- Event filtering helpers ---
+# (kind, modality) pairs persisted as-is, and (kind, modality) pairs persisted only with a summary
+_PERSIST_ALWAYS = frozenset({('UserMessage', 'text')})
+_PERSIST_WITH_SUMMARY = frozenset({('UserMessage', 'voice'), ('UserMessage', 'image')})
+
 def is_persistable_event(e: Dict[str, Any]) -> bool:
     kind = e.get('kind')
-    modality = e.get('modality')
-    channel = e.get('channel')
-    if kind == 'UserMessage' and modality == 'text':
+    kind_modality = (kind, e.get('modality'))
+    if kind_modality in _PERSIST_ALWAYS:
         return True
-    if kind == 'UserMessage' and modality in ('voice', 'image'):
+    if kind_modality in _PERSIST_WITH_SUMMARY:
         return bool(e.get('summary'))
-    if kind == 'ModelResponse' and channel == 'text':
-        return True
-    return False
+    return kind == 'ModelResponse' and e.get('channel') == 'text'
+
+# Fallback JSONL sink: one long-lived O_APPEND handle instead of open/close per session.
+# Records are written whole, so buffer flushes always land on line boundaries.
+_JSONL_PATH = 'memory_persisted.jsonl'
+_JSONL_BUFFER_SIZE = 1 << 16
+_JSONL_FLUSH_EVERY = 64
+# Lines are handed to a daemon writer thread; the request path only enqueues.
+# Bounded so a stalled writer cannot grow memory without limit.
+_JSONL_QUEUE_MAXSIZE = 1024
+_jsonl_queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=_JSONL_QUEUE_MAXSIZE)
+_jsonl_writer: Optional[threading.Thread] = None
+_jsonl_lock = threading.Lock()
+
+def _drain_jsonl() -> None:
+    try:
+        fd = os.open(_JSONL_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC, 0o644)
+        with os.fdopen(fd, 'ab', buffering=_JSONL_BUFFER_SIZE) as fh:
+            pending = 0
+            while True:
+                line = _jsonl_queue.get()
+                if line is None:
+                    break
+                fh.write(line)
+                pending += 1
+                # Flush in batches under load, immediately once the queue is idle
+                if pending >= _JSONL_FLUSH_EVERY or _jsonl_queue.empty():
+                    fh.flush()
+                    pending = 0
+    except Exception as e:
+        # Lines still queued are picked up by the writer _append_jsonl restarts
+        logger.warning(f"JSONL writer stopped: {e}")
+
+def _stop_jsonl_writer() -> None:
+    if _jsonl_writer is None or not _jsonl_writer.is_alive():
+        return
+    try:
+        _jsonl_queue.put(None, timeout=5)
+    except queue.Full:
+        return
+    _jsonl_writer.join(timeout=5)
+
+def _write_jsonl_direct(line: bytes) -> None:
+    """Synchronous append, used when the writer thread is behind."""
+    try:
+        with open(_JSONL_PATH, 'ab') as fh:
+            fh.write(line)
+    except OSError as e:
+        logger.warning(f"Dropped a JSONL record: {e}")
+
+def _append_jsonl(line: bytes) -> None:
+    global _jsonl_writer
+    if _jsonl_writer is None or not _jsonl_writer.is_alive():
+        with _jsonl_lock:
+            if _jsonl_writer is None or not _jsonl_writer.is_alive():
+                # First record, or the previous writer died (e.g. the file was unwritable)
+                if _jsonl_writer is None:
+                    atexit.register(_stop_jsonl_writer)
+                _jsonl_writer = threading.Thread(target=_drain_jsonl, name="memory-jsonl-writer", daemon=True)
+                _jsonl_writer.start()
+    try:
+        _jsonl_queue.put_nowait(line)
+    except queue.Full:
+        _write_jsonl_direct(line)
+
+_MEDIA_META_KEYS = ('language', 'mime', 'durationMs', 'sha256')
 
 def persist_memory_from_session(session) -> None:
     """Persist filtered session events if a memory service is available on session.
@@ -52,28 +136,42 @@ def persist_memory_from_session(session) -> None:
     This function is defensive to fit different session shapes.
     """
     try:
-        events: List[Dict[str, Any]] = []
+        # Classify persistable events in a single pass
+        user_messages: List[Optional[str]] = []
+        user_media_summaries: List[Dict[str, Any]] = []
+        model_responses: List[Optional[str]] = []
         for e in getattr(session, 'events', []) or []:
-            if isinstance(e, dict) and is_persistable_event(e):
-                events.append(e)
+            if not isinstance(e, dict) or not is_persistable_event(e):
+                continue
+            kind = e.get('kind')
+            if kind == 'UserMessage':
+                text = e.get('text')
+                if text:
+                    user_messages.append(redact(text))
+                summary = e.get('summary')
+                if summary:
+                    meta = e.get('meta') or {}
+                    user_media_summaries.append({
+                        'summary': redact(summary),
+                        'modality': e.get('modality'),
+                        'meta': {k: meta.get(k) for k in _MEDIA_META_KEYS},
+                    })
+            elif kind == 'ModelResponse':
+                model_responses.append(redact(e.get('text', '')))
+
+        state = getattr(session, 'state', None)
+        state_get = getattr(state, 'get', None) if state else None
 
         record = {
             'sessionId': getattr(session, 'id', None),
-            'user_messages': [redact(e.get('text', '')) for e in events if e.get('kind') == 'UserMessage' and e.get('text')],
-            'user_media_summaries': [
-                {
-                    'summary': redact(e.get('summary', '')),
-                    'modality': e.get('modality'),
-                    'meta': {k: (e.get('meta') or {}).get(k) for k in ['language', 'mime', 'durationMs', 'sha256']},
-                }
-                for e in events if e.get('kind') == 'UserMessage' and e.get('summary')
-            ],
-            'model_responses': [redact(e.get('text', '')) for e in events if e.get('kind') == 'ModelResponse'],
+            'user_messages': user_messages,
+            'user_media_summaries': user_media_summaries,
+            'model_responses': model_responses,
             'meta': {
                 'startedAt': getattr(session, 'startedAt', None),
                 'endedAt': getattr(session, 'endedAt', None),
-                'locale': getattr(getattr(session, 'state', None), 'get', lambda *_: None)('user.locale') if getattr(session, 'state', None) else None,
-                'intent': getattr(getattr(session, 'state', None), 'get', lambda *_: None)('conversation.intentSummary') if getattr(session, 'state', None) else None,
+                'locale': state_get('user.locale') if state_get else None,
+                'intent': state_get('conversation.intentSummary') if state_get else None,
             },
         }
 
@@ -84,15 +182,19 @@ def persist_memory_from_session(session) -> None:
             return
 
         # Fallback: append to a local JSONL file for auditing
-        with open('memory_persisted.jsonl', 'a', encoding='utf-8') as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        _append_jsonl(json_utils.dumps_bytes(record) + b"\n")
     except Exception as e:
         logger.warning(f"persist_memory_from_session failed: {e}")
 
+@functools.lru_cache(maxsize=256)
+def _temp_key(key: str) -> str:
+    # Tool cache keys repeat across calls; build and intern each namespaced key once
+    return sys.intern(f"tool.temp.{key}")
+
 def put_tool_cache(state: Any, key: str, value: Any, ttl_seconds: int = 900) -> None:
     """Put tool results into ephemeral state (non-persistent)."""
     try:
-        namespaced = f"tool.temp.{key}"
+        namespaced = _temp_key(key)
         if hasattr(state, 'set'):
             state.set(namespaced, value, ttl=ttl_seconds, persist=False, ephemeral=True)
         else:
@@ -102,7 +204,10 @@ def put_tool_cache(state: Any, key: str, value: Any, ttl_seconds: int = 900) ->
     except Exception as e:
         logger.debug(f"put_tool_cache failed: {e}")
 
-_INMEM_TURNS: Dict[str, list] = {}
+# In-memory turns, bounded: the most recent sessions (LRU) and turns per session
+_MAX_INMEM_SESSIONS = 1024
+_MAX_TURNS_PER_SESSION = 50
+_INMEM_TURNS: "OrderedDict[str, deque]" = OrderedDict()
 
 def save_persistable_turn(session_id: str, user_text: Optional[str], model_text: Optional[str], media_summary: Optional[Dict[str, Any]] = None) -> None:
     """Store only in-memory: user text/media summary and LLM text per turn."""
@@ -113,7 +218,14 @@ def save_persistable_turn(session_id: str, user_text: Optional[str], model_text:
             'model_text': redact(model_text) if model_text else None,
             'ts': time.time(),
         }
-        bucket = _INMEM_TURNS.setdefault(session_id or 'unknown', [])
+        sid = session_id or 'unknown'
+        bucket = _INMEM_TURNS.get(sid)
+        if bucket is None:
+            if len(_INMEM_TURNS) >= _MAX_INMEM_SESSIONS:
+                _INMEM_TURNS.popitem(last=False)
+            bucket = _INMEM_TURNS[sid] = deque(maxlen=_MAX_TURNS_PER_SESSION)
+        else:
+            _INMEM_TURNS.move_to_end(sid)
         bucket.append(record)
     except Exception as e:
         logger.debug(f"save_persistable_turn failed: {e}")
@@ -184,14 +296,16 @@ def forget(key: str, value: str, tool_context: ToolContext) -> Dict[str, Any]:
         if key not in tool_context.state:
             return {"status": f'Key "{key}" not found'}
         
-        if isinstance(tool_context.state[key], list):
-            if value in tool_context.state[key]:
-                tool_context.state[key].remove(value)
-                return {"status": f'Removed from "{key}": "{value}"'}
-            else:
+        current = tool_context.state[key]
+        if isinstance(current, list):
+            # list.remove does the membership scan itself; no separate `in` pass
+            try:
+                current.remove(value)
+            except ValueError:
                 return {"status": f'Value not found in "{key}"'}
+            return {"status": f'Removed from "{key}": "{value}"'}
         else:
-            if tool_context.state[key] == value:
+            if current == value:
                 del tool_context.state[key]
                 return {"status": f'Removed "{key}": "{value}"'}
             else:
@@ -223,6 +337,11 @@ def get_memory(key: str, tool_context: ToolContext) -> Dict[str, Any]:
         logger.error(f"Error retrieving memory: {e}")
         return {"status": f"Error retrieving memory: {str(e)}", "value": None}
 
+# Keys left out of list_memories: ephemeral tool caches and the bulky search log
+# (latest_search already carries the most recent entry)
+_LIST_SKIP_PREFIX = "tool.temp."
+_LIST_SKIP_KEYS = frozenset({"search_history"})
+
 def list_memories(tool_context: ToolContext) -> Dict[str, Any]:
     """
     List all stored memories.
@@ -234,7 +353,12 @@ def list_memories(tool_context: ToolContext) -> Dict[str, Any]:
         Dictionary of all stored memories.
     """
     try:
-        memories = dict(tool_context.state)
+        state = tool_context.state
+        items = state.to_dict().items() if hasattr(state, "to_dict") else state.items()
+        memories = {
+            k: v for k, v in items
+            if k not in _LIST_SKIP_KEYS and not k.startswith(_LIST_SKIP_PREFIX)
+        }
         logger.info(f"Listed {len(memories)} memories")
         
         return {"status": "success", "memories": memories}
@@ -261,6 +385,8 @@ def clear_memories(tool_context: ToolContext) -> Dict[str, Any]:
         logger.error(f"Error clearing memories: {e}")
         return {"status": f"Error clearing memories: {str(e)}"}
 
+_MAX_SEARCH_HISTORY = 200
+
 def store_search_memory(query: str, results_count: int, tool_context: ToolContext) -> Dict[str, Any]:
     """
     Store search-specific memory.
@@ -281,11 +407,19 @@ def store_search_memory(query: str, results_count: int, tool_context: ToolContex
             "type": "search"
         }
         
-        # Store in search history
-        memorize_list("search_history", json.dumps(search_memory, ensure_ascii=False), tool_context)
+        # Store the record itself (no per-call encoding); it is serialized only when persisted.
+        # History is a bounded list, reassigned so the state change is recorded as a delta.
+        state = tool_context.state
+        latest = state.get("latest_search")
+        # Same query again (e.g. next page): only latest_search is refreshed, no history copy
+        if not (isinstance(latest, dict) and latest.get("query") == query):
+            history = state.get("search_history")
+            history = list(history) if isinstance(history, list) else []
+            history.append(search_memory)
+            state["search_history"] = history[-_MAX_SEARCH_HISTORY:]
         
         # Store latest search
-        memorize("latest_search", json.dumps(search_memory, ensure_ascii=False), tool_context)
+        state["latest_search"] = search_memory
         
         logger.info(f"Search memory stored: {query} -> {results_count} results")
         
@@ -307,11 +441,13 @@ def store_user_preference(key: str, value: str, tool_context: ToolContext) -> Di
         Status message.
     """
     try:
-        preference_key = f"user_preference_{key}"
-        memorize(preference_key, value, tool_context)
-        
-        # Also store in preferences list
-        memorize_list("user_preferences", f"{key}:{value}", tool_context)
+        # All preferences live in one sub-dict, so reads need no scan of the whole state.
+        # Reassign a copy (not in-place update) so the state change is recorded as a delta.
+        state = tool_context.state
+        prefs = state.get("user_preferences")
+        prefs = dict(prefs) if isinstance(prefs, dict) else {}
+        prefs[key] = value
+        state["user_preferences"] = prefs
         
         logger.info(f"User preference stored: {key} = {value}")
         
@@ -331,13 +467,9 @@ def get_user_preferences(tool_context: ToolContext) -> Dict[str, Any]:
         Dictionary of user preferences.
     """
     try:
-        preferences = {}
-        memories = dict(tool_context.state)
-        
-        for key, value in memories.items():
-            if key.startswith("user_preference_"):
-                pref_key = key.replace("user_preference_", "")
-                preferences[pref_key] = value
+        preferences = tool_context.state.get("user_preferences")
+        if not isinstance(preferences, dict):
+            preferences = {}
         
         logger.info(f"Retrieved {len(preferences)} user preferences")
         
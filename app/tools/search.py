@@ -4,14 +4,19 @@ Uses the new Antsomi search engine for better product discovery.
 Optimized for minimal token usage with ADK Context patterns.
 """
 
+import asyncio
+import functools
 import logging
 import json
+import os
+import re
 import time
-from typing import Optional, Dict, Any, List
-import unicodedata
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 from google.adk.tools import ToolContext
+from app.shared_libraries import json_utils
+from app.shared_libraries.http_session import SharedSession
 import aiohttp
-import urllib.parse
 from .context_optimized_tools import context_optimizer
 
 logger = logging.getLogger(__name__)
@@ -23,27 +28,100 @@ DEFAULT_USER_ID = "564996752"  # Default user ID for testing
 DEFAULT_STORE_ID = "10010"
 DEFAULT_PRODUCT_TYPE = "B2C"
 
+# Built once; every Antsomi request sends the same headers
+_ANTSOMI_BASE = ANTISOMI_BASE_URL.rstrip("/") + "/"
+_ANTSOMI_HEADERS = {
+    "Authorization": f"Bearer {ANTISOMI_BEARER_TOKEN}",
+    "Content-Type": "application/json",
+    "Accept-Language": "vi",
+}
+_ANTSOMI_TIMEOUT = aiohttp.ClientTimeout(total=20)
+# Send filters as bracket query params (filters[brand]=X) instead of one JSON string.
+# Off by default: enable only once the Antsomi deployment accepts the bracket form.
+_FLAT_FILTERS = os.getenv("MMVN_ANTSOMI_FLAT_FILTERS", "").lower() in ("1", "true", "yes")
+
+# Shared HTTP session: keep-alive connections to Antsomi are reused across searches
+_http_session = SharedSession(
+    lambda: aiohttp.TCPConnector(limit=64, limit_per_host=16, ttl_dns_cache=300, keepalive_timeout=60)
+)
+
+
+def _get_http_session() -> aiohttp.ClientSession:
+    """Lấy session dùng chung, tạo mới nếu chưa có, đã đóng hoặc thuộc event loop khác."""
+    return _http_session.get()
+
+
+# Short-lived response cache for Antsomi calls (pagination clicks and retries repeat queries).
+# Concurrent identical requests share one in-flight fetch. Entries are kept serialized and
+# every caller gets its own parsed copy, so mutating a result cannot corrupt the cache.
+_RESPONSE_CACHE_MAXSIZE = 512
+_SEARCH_CACHE_TTL_SECONDS = 90
+_SUGGEST_CACHE_TTL_SECONDS = 300
+_response_cache: "OrderedDict[Tuple[Any, ...], Tuple[float, bytes]]" = OrderedDict()
+_inflight: Dict[Tuple[Any, ...], "asyncio.Task[Any]"] = {}
+
+
+def _on_fetch_done(key: Tuple[Any, ...], ttl: float, task: "asyncio.Task[Any]") -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if task.cancelled() or task.exception() is not None:
+        return  # failures are not cached
+    try:
+        payload = json_utils.dumps_bytes(task.result())
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Not caching unserializable response for {key[0]}: {e}")
+        return
+    _response_cache[key] = (time.monotonic() + ttl, payload)
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > _RESPONSE_CACHE_MAXSIZE:
+        _response_cache.popitem(last=False)
+
+
+async def _cached_request(key: Tuple[Any, ...], fetch, ttl: float) -> Any:
+    """Trả về kết quả cache còn hạn, hoặc dùng chung một lần gọi fetch() cho các request trùng key."""
+    entry = _response_cache.get(key)
+    if entry is not None:
+        if entry[0] > time.monotonic():
+            _response_cache.move_to_end(key)
+            return json_utils.loads(entry[1])
+        del _response_cache[key]
+    loop = asyncio.get_running_loop()
+    task = _inflight.get(key)
+    if task is None or task.get_loop() is not loop:
+        task = loop.create_task(fetch())
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_on_fetch_done, key, ttl))
+    # shield: one caller being cancelled must not cancel the fetch other callers wait on
+    result = await asyncio.shield(task)
+    return json_utils.loads(json_utils.dumps_bytes(result))
+
+
+_PRICE_RE = re.compile(r"[0-9.]+")
+
+
+def _parse_price(value: Any, default: Optional[float]) -> Optional[float]:
+    """Parse a non-negative price from a number or digit string; default otherwise."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value) if value >= 0 else default
+    if isinstance(value, str) and _PRICE_RE.fullmatch(value):
+        try:
+            return float(value)
+        except ValueError:  # e.g. "1.2.3"
+            return default
+    return default
+
 
 def _to_minimal_product(product: Dict[str, Any]) -> Dict[str, Any]:
     """Convert Antsomi API product response to minimal format expected by frontend."""
     # Extract price information
-    current_price = 0
-    original_price = None
+    current_price = _parse_price(product.get("price", "0"), 0)
+    original_price = _parse_price(product.get("original_price", "0"), None)
     discount_percentage = None
-    
-    try:
-        price_str = str(product.get("price", "0"))
-        original_price_str = str(product.get("original_price", "0"))
-        
-        current_price = float(price_str) if price_str.replace(".", "").isdigit() else 0
-        original_price = float(original_price_str) if original_price_str.replace(".", "").isdigit() else None
-        
-        # Calculate discount if original price is higher
-        if original_price and original_price > current_price:
-            discount_amount = original_price - current_price
-            discount_percentage = f"{round((discount_amount / original_price) * 100)}%"
-    except Exception:
-        pass
+
+    # Calculate discount if original price is higher
+    if original_price and original_price > current_price:
+        discount_amount = original_price - current_price
+        discount_percentage = f"{round((discount_amount / original_price) * 100)}%"
 
     # Build product URL from page_url field
     product_url = product.get("page_url", "")
@@ -62,7 +140,7 @@ def _to_minimal_product(product: Dict[str, Any]) -> Dict[str, Any]:
             "currency": "VND",
             "discount": discount_percentage,
         },
-        "image": {"url": image_url},
+        "imageUrl": image_url,
         "description": "",  # Antsomi API doesn't provide description
         "productUrl": product_url,
         "category": product.get("category", ""),
@@ -72,31 +150,44 @@ def _to_minimal_product(product: Dict[str, Any]) -> Dict[str, Any]:
     return minimal
 
 
+def _product_sort_key(product: Dict[str, Any]) -> Tuple[bool, str, str]:
+    """Sort by category name (empty last), then by product name."""
+    category = product.get("category") or ""
+    return (not category, category, product.get("name") or "")
+
+
+def _flatten_filters(filters: Dict[str, Any], prefix: str = "filters") -> Dict[str, Any]:
+    """{"brand": "X"} -> {"filters[brand]": "X"}; non-scalar values are JSON-encoded."""
+    out: Dict[str, Any] = {}
+    for k, v in filters.items():
+        if isinstance(v, (str, int, float)) and not isinstance(v, bool):
+            out[f"{prefix}[{k}]"] = v
+        else:
+            out[f"{prefix}[{k}]"] = json_utils.dumps(v)
+    return out
 
 
 async def _antsomi_request(session: aiohttp.ClientSession, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
     """Make request to Antsomi API with proper authentication."""
-    url = f"{ANTISOMI_BASE_URL}/{endpoint}"
-    headers = {
-        "Authorization": f"Bearer {ANTISOMI_BEARER_TOKEN}",
-        "Content-Type": "application/json",
-        "Accept-Language": "vi",
-    }
+    url = _ANTSOMI_BASE + endpoint
     
-    logger.info(f"[Antsomi] GET {url} params={json.dumps(params, ensure_ascii=False)}")
-    async with session.get(url, params=params, headers=headers, timeout=aiohttp.ClientTimeout(total=20)) as resp:
-        text = await resp.text()
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("[Antsomi] GET %s params=%s", url, json_utils.dumps(params))
+    async with session.get(url, params=params, headers=_ANTSOMI_HEADERS, timeout=_ANTSOMI_TIMEOUT) as resp:
+        # Raw bytes go straight to the JSON parser; decoding happens only for error logs
+        body = await resp.read()
         try:
             resp.raise_for_status()
-        except Exception as e:
-            logger.error(f"[Antsomi] HTTP {resp.status} body={text[:500]}")
+        except Exception:
+            logger.error("[Antsomi] HTTP %s body=%s", resp.status, body[:500].decode("utf-8", "replace"))
             raise
         try:
-            data = json.loads(text)
-        except Exception:
-            logger.error(f"[Antsomi] Non-JSON response body prefix: {text[:200]}")
-            data = {"raw": text}
-        logger.info(f"[Antsomi] OK {endpoint} keys={list(data.keys())}")
+            data = json_utils.loads(body)
+        except ValueError:
+            logger.error("[Antsomi] Non-JSON response body prefix: %s", body[:200].decode("utf-8", "replace"))
+            data = {"raw": body.decode("utf-8", "replace")}
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Antsomi] OK %s keys=%s", endpoint, list(data.keys()))
         return data
 
 
@@ -110,8 +201,11 @@ async def suggest_keywords(query: str, user_id: str = DEFAULT_USER_ID) -> List[s
             "product_type": DEFAULT_PRODUCT_TYPE
         }
         
-        async with aiohttp.ClientSession() as session:
-            data = await _antsomi_request(session, "suggest", params)
+        data = await _cached_request(
+            ("suggest", *params.items()),
+            lambda: _antsomi_request(_get_http_session(), "suggest", params),
+            _SUGGEST_CACHE_TTL_SECONDS,
+        )
         
         suggestions = data.get("suggestions", [])
         return [s.get("keyword", "") for s in suggestions if s.get("keyword")]
@@ -120,6 +214,41 @@ async def suggest_keywords(query: str, user_id: str = DEFAULT_USER_ID) -> List[s
         return []
 
 
+# Request shapes Antsomi deployments have answered to, in probing order. The first shape
+# that returns a results-like payload is remembered and tried first on later searches.
+_SEARCH_SHAPES: Tuple[Tuple[str, str], ...] = (("smart_search", "q"), ("smart_search", "query"), ("search", "q"))
+_RESULT_KEYS = ("results", "items", "data")
+_antsomi_shape: Tuple[str, str] = _SEARCH_SHAPES[0]
+
+
+async def _smart_search(query: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """smart_search with the legacy shape fallbacks; raises if the first request fails."""
+    global _antsomi_shape
+    session = _get_http_session()
+    shapes = [_antsomi_shape] + [shape for shape in _SEARCH_SHAPES if shape != _antsomi_shape]
+    data: Optional[Dict[str, Any]] = None
+    for endpoint, qkey in shapes:
+        if qkey == "q":
+            shape_params = params
+        else:
+            shape_params = {k: v for k, v in params.items() if k != "q"}
+            shape_params[qkey] = query
+        try:
+            candidate = await _antsomi_request(session, endpoint, shape_params)
+        except Exception:
+            if data is None:
+                raise
+            continue
+        if any(k in candidate for k in _RESULT_KEYS):
+            if (endpoint, qkey) != _antsomi_shape:
+                logger.info("[Antsomi] Using request shape endpoint=%s query_param=%s", endpoint, qkey)
+                _antsomi_shape = (endpoint, qkey)
+            return candidate
+        if data is None:
+            data = candidate
+    return data
+
+
 async def search_products_antsomi(query: str, user_id: str = DEFAULT_USER_ID, 
                                  filters: Optional[Dict[str, Any]] = None,
                                  page: int = 1, limit: int = 20) -> Dict[str, Any]:
@@ -136,38 +265,67 @@ async def search_products_antsomi(query: str, user_id: str = DEFAULT_USER_ID,
         
         # Add filters if provided
         if filters:
-            params["filters"] = json.dumps(filters)
-        
-        async with aiohttp.ClientSession() as session:
-            data = await _antsomi_request(session, "smart_search", params)
-            # Fallback 1: if no results-like keys, try using 'query' instead of 'q'
-            if not any(k in data for k in ("results", "items", "data")):
-                alt_params = dict(params)
-                alt_params.pop("q", None)
-                alt_params["query"] = query
-                try:
-                    data_alt = await _antsomi_request(session, "smart_search", alt_params)
-                    if any(k in data_alt for k in ("results", "items", "data")):
-                        data = data_alt
-                except Exception:
-                    pass
-            # Fallback 2: try a different endpoint name 'search'
-            if not any(k in data for k in ("results", "items", "data")):
-                try:
-                    data_search = await _antsomi_request(session, "search", params)
-                    data = data_search
-                except Exception:
-                    pass
+            if _FLAT_FILTERS:
+                params.update(_flatten_filters(filters))
+            else:
+                params["filters"] = json_utils.dumps(filters)
         
-        return data
+        return await _cached_request(
+            ("smart_search", *params.items()),
+            lambda: _smart_search(query, params),
+            _SEARCH_CACHE_TTL_SECONDS,
+        )
     except Exception as e:
         logger.error(f"Antsomi search failed: {e}")
         return {"results": [], "total": "0", "type": "", "categories": {}}
 
 
+def _extract_results(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Products from any known response shape: results, data.results or items."""
+    results = payload.get("results")
+    data = payload.get("data")
+    if results is None and isinstance(data, dict):
+        results = data.get("results")
+    if results is None and isinstance(payload.get("items"), list):
+        results = payload["items"]
+    return results or []
+
+
+def _extract_total(payload: Dict[str, Any]) -> int:
+    """Total hit count from total or data.total; 0 when missing or not an integer."""
+    total = payload.get("total")
+    data = payload.get("data")
+    if total is None and isinstance(data, dict):
+        total = data.get("total")
+    try:
+        return int(total) if total is not None else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def _finalize(raw_results: List[Dict[str, Any]], query: str, total: int, search_type: str,
+              categories: Any, pagination: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], str]:
+    """Minimize + sort products and build the optimized JSON response; returns (products, json)."""
+    products = [_to_minimal_product(p) for p in raw_results]
+    # Sort by category name (empty last), then by product name
+    products.sort(key=_product_sort_key)
+    search_metadata: Dict[str, Any] = {
+        "total": str(total),
+        "search_type": search_type,
+        "categories": categories,
+    }
+    if pagination is not None:
+        search_metadata["pagination"] = pagination
+    # Use context optimizer for minimal response
+    json_response = context_optimizer.optimize_search_response(
+        {"products": products, "search_metadata": search_metadata}, query
+    )
+    return products, json_response
+
+
 async def search_products(keywords: Optional[str] = None, tool_context: ToolContext = None, filters_json: Optional[str] = None, page: Optional[int] = None) -> str:
     """Main search function using Antsomi CDP 365 API Smart Search."""
-    start_time = time.time()
+    t0 = time.perf_counter()  # monotonic clock for latency
     try:
         # Manage pagination state in ToolContext.state
         # Normalize and backfill missing inputs from state when possible
@@ -193,26 +351,31 @@ async def search_products(keywords: Optional[str] = None, tool_context: ToolCont
         # Backfill keywords from prior state if missing/empty
         if not keywords or (isinstance(keywords, str) and not keywords.strip()):
             try:
-                prev = getattr(tool_context, 'state', {}) or {}
-                if isinstance(prev, dict):
-                    if isinstance(prev.get(state_key), dict) and prev[state_key].get('keywords'):
-                        keywords = prev[state_key]['keywords']
-                    elif isinstance(prev.get('latest_search'), str):
-                        try:
-                            latest = json.loads(prev['latest_search'])
-                            if isinstance(latest, dict) and latest.get('query'):
-                                keywords = latest['query']
-                        except Exception:
-                            pass
+                # ADK State is dict-like but not a dict subclass: rely on .get only
+                prev = getattr(tool_context, 'state', None)
+                if prev is not None and hasattr(prev, 'get'):
+                    prev_search = prev.get(state_key)
+                    if isinstance(prev_search, dict) and prev_search.get('keywords'):
+                        keywords = prev_search['keywords']
+                    else:
+                        latest = prev.get('latest_search')
+                        if isinstance(latest, str):
+                            # Serialized record: parse only when it looks like a JSON object
+                            try:
+                                latest = json_utils.loads(latest) if latest.startswith('{') else None
+                            except ValueError:
+                                latest = None
+                        if isinstance(latest, dict) and latest.get('query'):
+                            keywords = latest['query']
             except Exception:
                 pass
         # Final guard: if still missing, return a user-friendly message instead of failing
         if not keywords or not str(keywords).strip():
-            return json.dumps({
+            return json_utils.dumps({
                 "type": "product-display",
                 "message": "Không có từ khóa tìm kiếm. Vui lòng nhập từ khóa (ví dụ: 'sữa tươi').",
                 "products": []
-            }, ensure_ascii=False)
+            })
         # If page is not specified or invalid, default to 1 (no auto-increment)
         try:
             page = int(page) if page is not None else 1
@@ -231,17 +394,18 @@ async def search_products(keywords: Optional[str] = None, tool_context: ToolCont
 
         logger.info("[Antsomi] Smart search: %s (page: %d)", keywords, page)
         
-        # Log tool usage
-        log_entry = {
-            "timestamp": time.time(),
-            "tool": "search_products",
-            "input": {
-                "keywords": keywords,
-                "filters": filters,
-                "page": page
+        # Log tool usage (skip building/serializing the entry when INFO is off)
+        if logger.isEnabledFor(logging.INFO):
+            log_entry = {
+                "timestamp": time.time(),
+                "tool": "search_products",
+                "input": {
+                    "keywords": keywords,
+                    "filters": filters,
+                    "page": page
+                }
             }
-        }
-        logger.info(f"TOOL_USAGE: {json.dumps(log_entry, ensure_ascii=False)}")
+            logger.info("TOOL_USAGE: %s", json_utils.dumps(log_entry))
         
         # Keep original keywords with Vietnamese accents - no accent stripping
         search_query = keywords
@@ -250,111 +414,86 @@ async def search_products(keywords: Optional[str] = None, tool_context: ToolCont
         search_result = await search_products_antsomi(search_query, filters=filters, page=page, limit=20)
         
         # Handle multiple possible response shapes
-        results = search_result.get("results")
-        if results is None and isinstance(search_result.get("data"), dict):
-            results = search_result.get("data", {}).get("results", [])
-        if results is None and isinstance(search_result.get("items"), list):
-            results = search_result.get("items", [])
-        results = results or []
-
-        total = search_result.get("total")
-        if total is None and isinstance(search_result.get("data"), dict):
-            total = search_result.get("data", {}).get("total")
-        total = str(total) if total is not None else "0"
+        results = _extract_results(search_result)
+        # Keep the count as an int for the math; it is emitted as a string for compatibility
+        total_int = _extract_total(search_result)
 
         search_type = search_result.get("type", "")
-        categories = search_result.get("categories", {})
-        
-        # Convert to minimal product format
-        minimal_products = [_to_minimal_product(p) for p in results]
-        
-        # Sort by category name (empty last), then by product name
-        minimal_products.sort(key=lambda x: ((x.get("category") or "") == "", (x.get("category") or ""), x.get("name") or ""))
-        
-        # Use context optimizer for minimal response
-        search_data = {
-            "products": minimal_products,
-            "search_metadata": {
-                "total": total,
-                "search_type": search_type,
-                "categories": categories,
-                "pagination": {
-                    "current_page": page,
-                    "total_pages": (int(total) + 19) // 20 if total != "0" else 1,
-                    "items_per_page": 20,
-                    "has_next_page": page < ((int(total) + 19) // 20 if total != "0" else 1),
-                    "has_prev_page": page > 1
-                }
-            }
+        total = str(total_int)
+        total_pages = max(1, (total_int + 19) // 20)
+        pagination = {
+            "current_page": page,
+            "total_pages": total_pages,
+            "items_per_page": 20,
+            "has_next_page": page < total_pages,
+            "has_prev_page": page > 1
         }
-        
-        # Optimize response using context optimizer
-        json_response = context_optimizer.optimize_search_response(search_data, keywords)
+        minimal_products, json_response = _finalize(
+            results, keywords, total_int, search_type, search_result.get("categories", {}), pagination
+        )
         
         # If no results, log payload and try suggest->requery or simplified variants (keep Vietnamese accents)
         if not minimal_products:
-            try:
-                logger.info(f"[Antsomi] Empty results payload keys={list(search_result.keys())} sample={json.dumps({k: search_result[k] for k in list(search_result)[:3]}, ensure_ascii=False)[:400]}")
-            except Exception:
-                pass
-            # 0) Try suggest API to get a close keyword
-            try:
-                suggestions = await suggest_keywords(keywords)
-            except Exception:
-                suggestions = []
-            fallback_queries = []
-            if suggestions:
-                fallback_queries.append(suggestions[0])
-
-            # 1) Keep only first two words
+            if logger.isEnabledFor(logging.INFO):
+                try:
+                    sample = json_utils.dumps({k: search_result[k] for k in list(search_result)[:3]})[:400]
+                    logger.info("[Antsomi] Empty results payload keys=%s sample=%s", list(search_result.keys()), sample)
+                except Exception:
+                    pass
+            # Word-trim fallbacks: first two words, then the first word alone
             words = keywords.split()
+            trim_queries = []
             if len(words) > 2:
-                fallback_queries.append(' '.join(words[:2]))
-
-            # 2) Single first word
+                trim_queries.append(' '.join(words[:2]))
             if words:
-                fallback_queries.append(words[0])
+                trim_queries.append(words[0])
+            trim_queries = [q for q in dict.fromkeys(trim_queries) if q]
 
-            # Deduplicate fallback queries while preserving order
-            seen = set()
-            unique_fallbacks = []
-            for fq in fallback_queries:
-                if fq and fq not in seen:
-                    unique_fallbacks.append(fq)
-                    seen.add(fq)
+            # The suggest API and the word-trim searches don't depend on each other: run them together
+            suggestions, *trim_results = await asyncio.gather(
+                suggest_keywords(keywords),
+                *(search_products_antsomi(q, filters=None, page=page, limit=20) for q in trim_queries),
+                return_exceptions=True,
+            )
+            fallback_results = dict(zip(trim_queries, trim_results))
+            fallback_queries = []
+            if isinstance(suggestions, list) and suggestions:
+                fallback_queries.append(suggestions[0])
+            fallback_queries.extend(trim_queries)
+
+            # Deduplicate fallback queries while preserving order (suggestion first)
+            unique_fallbacks = [fq for fq in dict.fromkeys(fallback_queries) if fq]
+            if unique_fallbacks and unique_fallbacks[0] not in fallback_results:
+                suggested = unique_fallbacks[0]
+                fallback_results[suggested] = await search_products_antsomi(suggested, filters=None, page=page, limit=20)
 
-            # Try fallback queries
+            # Pick the first fallback with results, in priority order
             for fallback_query in unique_fallbacks:
-                logger.info(f"Trying fallback search: {fallback_query}")
-                fallback_result = await search_products_antsomi(fallback_query, filters=None, page=page, limit=20)
-                fb_results = fallback_result.get("results") or fallback_result.get("data", {}).get("results", []) or fallback_result.get("items", []) or []
+                logger.info("Trying fallback search: %s", fallback_query)
+                fallback_result = fallback_results[fallback_query]
+                if isinstance(fallback_result, BaseException):
+                    continue
+                fb_results = _extract_results(fallback_result)
                 if fb_results:
-                    minimal_products = [_to_minimal_product(p) for p in fb_results]
-                    minimal_products.sort(key=lambda x: ((x.get("category") or "") == "", (x.get("category") or ""), x.get("name") or ""))
-                    fallback_data = {
-                        "products": minimal_products,
-                        "search_metadata": {
-                            "total": fallback_result.get("total", "0"),
-                            "search_type": fallback_result.get("type", ""),
-                            "categories": fallback_result.get("categories", {})
-                        }
-                    }
-                    json_response = context_optimizer.optimize_search_response(fallback_data, fallback_query)
+                    minimal_products, json_response = _finalize(
+                        fb_results, fallback_query, _extract_total(fallback_result),
+                        fallback_result.get("type", ""), fallback_result.get("categories", {})
+                    )
                     break
         
         # Log tool completion
-        end_time = time.time()
-        log_entry = {
-            "timestamp": end_time,
-            "tool": "search_products",
-            "output": {
-                "products_found": len(minimal_products),
-                "total_results": total,
-                "search_type": search_type,
-                "processing_time": end_time - start_time
+        if logger.isEnabledFor(logging.INFO):
+            log_entry = {
+                "timestamp": time.time(),
+                "tool": "search_products",
+                "output": {
+                    "products_found": len(minimal_products),
+                    "total_results": total,
+                    "search_type": search_type,
+                    "processing_time": time.perf_counter() - t0
+                }
             }
-        }
-        logger.info(f"TOOL_COMPLETION: {json.dumps(log_entry, ensure_ascii=False)}")
+            logger.info("TOOL_COMPLETION: %s", json_utils.dumps(log_entry))
         
         return json_response
         
@@ -367,9 +506,9 @@ async def search_products(keywords: Optional[str] = None, tool_context: ToolCont
             "timestamp": end_time,
             "tool": "search_products",
             "error": str(e),
-            "processing_time": end_time - start_time
+            "processing_time": time.perf_counter() - t0
         }
-        logger.error(f"TOOL_ERROR: {json.dumps(log_entry, ensure_ascii=False)}")
+        logger.error(f"TOOL_ERROR: {json_utils.dumps(log_entry)}")
         
         return f"Lỗi khi tìm kiếm sản phẩm: {str(e)}"
 
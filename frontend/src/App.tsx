@@ -16,7 +16,7 @@ import {
   generateSmartSessionName,
   extractChatTopics
 } from '@/utils/sessionUtils';
-import { extractProductData } from '@/utils/messageParser';
+import { extractProductData, parseToolProductResult } from '@/utils/messageParser';
 import { SessionManager } from '@/components/SessionManager';
 
 // Update DisplayData to be a string type
@@ -263,23 +263,20 @@ export default function App() {
 
       // Immediately set productData if the tool returned product-display JSON
       try {
-        const resultText = functionResponse.response?.result as string | undefined;
-        if (resultText && resultText.trim().startsWith('{') && resultText.trim().endsWith('}')) {
-          const parsed = JSON.parse(resultText);
-          if (parsed && parsed.type === 'product-display' && Array.isArray(parsed.products)) {
-            setMessages(prev => {
-              const updated = [...prev];
-              const aiMessageIndex = updated.findIndex(m => m.id === aiMessageId);
-              if (aiMessageIndex !== -1) {
-                updated[aiMessageIndex] = {
-                  ...updated[aiMessageIndex],
-                  productData: parsed,
-                  finalReportWithCitations: true
-                };
-              }
-              return updated;
-            });
-          }
+        const parsed = parseToolProductResult(functionResponse.response?.result);
+        if (parsed) {
+          setMessages(prev => {
+            const updated = [...prev];
+            const aiMessageIndex = updated.findIndex(m => m.id === aiMessageId);
+            if (aiMessageIndex !== -1) {
+              updated[aiMessageIndex] = {
+                ...updated[aiMessageIndex],
+                productData: parsed,
+                finalReportWithCitations: true
+              };
+            }
+            return updated;
+          });
         }
       } catch (e) {
         console.warn('[SSE HANDLER] Failed to parse functionResponse result as JSON', e);
@@ -464,16 +461,10 @@ export default function App() {
             for (const part of event.content.parts) {
               const fr = part.functionResponse;
               if (fr?.response?.result && typeof fr.response.result === 'string') {
-                const result = fr.response.result.trim();
-                if (result.startsWith('{') && result.endsWith('}')) {
-                  try {
-                    const parsed = JSON.parse(result);
-                    if (parsed?.type === 'product-display' && Array.isArray(parsed.products)) {
-                      productData = parsed;
-                    }
-                  } catch (e) {
-                    console.warn('[RUN AGENT] Failed to parse function result JSON', e);
-                  }
+                try {
+                  productData = parseToolProductResult(fr.response.result) ?? productData;
+                } catch (e) {
+                  console.warn('[RUN AGENT] Failed to parse function result JSON', e);
                 }
               } else if (part.text) {
                 finalText = part.text;
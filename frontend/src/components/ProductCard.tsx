@@ -115,7 +115,7 @@ const ProductCard: React.FC<ProductCardProps> = ({
             <div className="aspect-square w-full">
               {!imageError ? (
                 <img
-                  src={product.image.url}
+                  src={product.imageUrl ?? product.image?.url}
                   alt={product.name}
                   className={`w-full h-full object-cover transition-opacity duration-300 ${
                     imageLoading ? 'opacity-0' : 'opacity-100'
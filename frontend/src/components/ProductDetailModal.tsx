@@ -93,7 +93,7 @@ const ProductDetailModal: React.FC<ProductDetailModalProps> = ({
             <div className="relative aspect-square bg-gray-100 rounded-lg overflow-hidden">
               {!imageError ? (
                 <img
-                  src={product.image.url}
+                  src={product.imageUrl ?? product.image?.url}
                   alt={product.name}
                   className={`w-full h-full object-cover transition-opacity duration-300 ${
                     imageLoading ? 'opacity-0' : 'opacity-100'
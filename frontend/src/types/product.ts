@@ -12,6 +12,7 @@ export interface ProductCardData {
     url: string;
     // Removed alt since it's not available in API
   };
+  imageUrl?: string; // Flat image URL sent by tool responses
   description?: string; // Optional since description.html can be empty
   productUrl: string; // Link to C&G product page
   unit?: string; // Optional unit_ecom field
@@ -0,0 +1,57 @@
+import assert from 'node:assert/strict';
+import { describe, it } from 'node:test';
+import { parseMessage, parseToolProductResult } from './messageParser.ts';
+
+// Tool output exactly as search_products / explore_product return it: flat imageUrl, no image object
+const toolResult = JSON.stringify({
+  type: 'product-display',
+  message: 'Tìm thấy 2 sản phẩm phù hợp',
+  products: [
+    { id: 1, name: 'Sữa tươi', price: { current: 32000, currency: 'VND' }, imageUrl: 'https://cdn/a.jpg', productUrl: 'https://shop/a', category: 'Sữa' },
+    { id: 2, name: 'Sữa chua', price: { current: 8000, currency: 'VND' }, productUrl: 'https://shop/b' },
+  ],
+  groups: [
+    { title: 'sữa', products: [{ id: 3, name: 'Bơ', price: { current: 1, currency: 'VND' }, imageUrl: 'https://cdn/c.jpg', productUrl: '' }] },
+  ],
+});
+
+// One SSE `data:` payload carrying the tool's functionResponse, as the streaming handler receives it
+const sseEvent = JSON.stringify({
+  author: 'mmvn_agent',
+  content: { parts: [{ functionResponse: { id: 'call-1', name: 'search_products', response: { result: toolResult } } }] },
+});
+
+describe('parseToolProductResult (streaming functionResponse path)', () => {
+  it('normalizes flat imageUrl into image.url for every product', () => {
+    const part = JSON.parse(sseEvent).content.parts[0];
+    const data = parseToolProductResult(part.functionResponse.response.result);
+
+    assert.ok(data);
+    assert.equal(data.products[0].image.url, 'https://cdn/a.jpg');
+    assert.equal(data.products[1].image.url, '');
+    assert.equal(data.groups![0].products[0].image.url, 'https://cdn/c.jpg');
+  });
+
+  it('returns null for non product-display results', () => {
+    assert.equal(parseToolProductResult(JSON.stringify({ status: 'success' })), null);
+    assert.equal(parseToolProductResult('Lỗi khi tìm kiếm sản phẩm: timeout'), null);
+    assert.equal(parseToolProductResult(undefined), null);
+  });
+
+  it('keeps an existing image object untouched', () => {
+    const data = parseToolProductResult(JSON.stringify({
+      type: 'product-display',
+      message: '',
+      products: [{ id: 'x', name: 'n', price: { current: 1, currency: 'VND' }, image: { url: 'u' }, productUrl: '' }],
+    }));
+    assert.equal(data!.products[0].image.url, 'u');
+  });
+});
+
+describe('parseMessage', () => {
+  it('normalizes products embedded in a text reply', () => {
+    const parsed = parseMessage('```json\n' + toolResult + '\n```');
+    assert.equal(parsed.type, 'product-display');
+    assert.equal(parsed.productData!.products[0].image.url, 'https://cdn/a.jpg');
+  });
+});
@@ -1,4 +1,36 @@
-import { ProductDisplayMessage } from '@/types/product';
+import { ProductCardData, ProductDisplayMessage } from '@/types/product';
+
+// Tool responses send a flat `imageUrl` (fewer tokens); cards read `image.url`
+export function normalizeProduct(product: any): ProductCardData {
+  if (product && !product.image) {
+    return { ...product, image: { url: product.imageUrl ?? '' } };
+  }
+  return product;
+}
+
+// Normalize every product (top-level and grouped) of a product-display payload in place
+export function normalizeProductDisplay(data: any): ProductDisplayMessage {
+  data.products = data.products.map(normalizeProduct);
+  if (Array.isArray(data.groups)) {
+    data.groups = data.groups.map((group: any) => ({
+      ...group,
+      products: Array.isArray(group.products) ? group.products.map(normalizeProduct) : group.products,
+    }));
+  }
+  return data;
+}
+
+// Raw tool result string (functionResponse.response.result) -> normalized product data, or null
+export function parseToolProductResult(result: unknown): ProductDisplayMessage | null {
+  if (typeof result !== 'string') return null;
+  const text = result.trim();
+  if (!text.startsWith('{') || !text.endsWith('}')) return null;
+  const parsed = JSON.parse(text);
+  if (parsed?.type === 'product-display' && Array.isArray(parsed.products)) {
+    return normalizeProductDisplay(parsed);
+  }
+  return null;
+}
 
 export interface ParsedMessage {
   type: 'text' | 'product-display';
@@ -246,6 +278,8 @@ export function parseMessage(content: string): ParsedMessage {
           }
         }
         
+        normalizeProductDisplay(parsedData);
+
         return {
           type: 'product-display',
           text: cleanText,
@@ -0,0 +1,80 @@
+"""
+Test script để kiểm tra TOON encoding của context optimizer
+"""
+
+import sys
+import os
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.shared_libraries import json_utils
+from app.tools.context_optimized_tools import ContextOptimizedToolWrapper, _to_toon, _toon_scalar
+
+PRODUCTS = [
+    {"id": "1", "name": "Sữa tươi, 1L", "price": {"current": 32000, "currency": "VND"}, "imageUrl": "", "category": "sua"},
+    {"id": "2", "name": "Sữa chua", "price": {"current": 5000, "currency": "VND"}, "imageUrl": "u2", "category": "sua"},
+]
+
+
+def test_toon_table_flattens_nested_values():
+    """Nested dicts become dotted columns; one row per product"""
+    assert _to_toon("products", PRODUCTS) == "\n".join([
+        "products[2]{id,name,price.current,price.currency,imageUrl,category}:",
+        '  "1","Sữa tươi, 1L",32000,VND,"",sua',
+        '  "2",Sữa chua,5000,VND,u2,sua',
+    ])
+
+
+def test_toon_scalar_quoting():
+    """Cells that would be misread are quoted, plain text is not"""
+    assert _toon_scalar("Sữa chua") == "Sữa chua"
+    assert _toon_scalar("a,b") == '"a,b"'
+    assert _toon_scalar('say "hi"') == '"say \\"hi\\""'
+    assert _toon_scalar("x: y") == '"x: y"'
+    assert _toon_scalar(" padded") == '" padded"'
+    assert _toon_scalar("") == '""'
+    assert _toon_scalar("42") == '"42"'
+    assert _toon_scalar("true") == '"true"'
+    assert _toon_scalar(None) == "null"
+    assert _toon_scalar(False) == "false"
+    assert _toon_scalar(1.5) == "1.5"
+
+
+def test_toon_header_covers_every_row():
+    """Columns come from all rows, so an empty first row cannot hide later fields"""
+    assert _to_toon("p", [{"a": 1, "i": {}}, {"a": 2, "i": {"u": "x"}}]) is None
+    assert _to_toon("p", [{"a": 1}, {"a": 2, "b": 3}]) is None
+    assert _to_toon("p", [{"a": 1, "i": {"u": "x"}}, {"a": 2, "i": {"u": "y", "v": 1}}]) is None
+    assert _to_toon("p", [{"b": 1, "a": 2}, {"a": 3, "b": 4}]) == "p[2]{b,a}:\n  1,2\n  4,3"
+
+
+def test_toon_rejects_lists_and_deep_nesting():
+    assert _to_toon("p", [{"a": [1, 2]}]) is None
+    assert _to_toon("p", [{"a": {"b": {"c": 1}}}]) is None
+    assert _to_toon("p", [{"a": 1, "i": {"u": "x"}}, {"a": 2, "i": 5}]) is None
+    assert _to_toon("p", []) is None
+
+
+def test_encode_response_falls_back_to_json():
+    """Mixed-key product lists are sent as JSON even with TOON enabled"""
+    wrapper = ContextOptimizedToolWrapper(use_toon=True)
+    response = {"type": "product-display", "products": [{"id": 1}, {"id": 2, "name": "x"}]}
+    assert json_utils.loads(wrapper._encode_response(response)) == response
+
+
+def test_encode_response_toon():
+    wrapper = ContextOptimizedToolWrapper(use_toon=True)
+    encoded = wrapper._encode_response({
+        "type": "product-display",
+        "products": PRODUCTS,
+        "metadata": {"total": 2, "showing": 2},
+    })
+    assert encoded.splitlines()[0] == "type: product-display"
+    assert "products[2]{id,name,price.current,price.currency,imageUrl,category}:" in encoded
+    assert encoded.endswith("metadata:\n  total: 2\n  showing: 2")
+
+
+def test_toon_off_by_default():
+    response = {"type": "product-display", "products": PRODUCTS}
+    assert ContextOptimizedToolWrapper()._encode_response(response) == json_utils.dumps(response)
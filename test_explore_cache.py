@@ -0,0 +1,121 @@
+"""
+Test script để kiểm tra item cache và SKU batching của explore tool
+"""
+
+import asyncio
+import sys
+import os
+
+import pytest
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.shared_libraries import json_utils
+from app.tools import explore
+
+
+def _item(sku):
+    return {"id": sku, "sku": sku, "name": f"Sản phẩm {sku}", "price_range": {}}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self._payload = payload
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def json(self):
+        return self._payload
+
+
+class FakeSession:
+    """Stands in for the shared aiohttp session: answers SKU IN queries, records requests"""
+
+    def __init__(self):
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        skus = json["variables"]["skus"]
+        self.requests.append(list(skus))
+        session = self
+
+        class _Response(FakeResponse):
+            async def __aenter__(self):
+                session.active += 1
+                session.max_active = max(session.max_active, session.active)
+                await asyncio.sleep(0.01)
+                session.active -= 1
+                return self
+
+        return _Response({"data": {"products": {"items": [_item(sku) for sku in skus]}}})
+
+
+@pytest.fixture
+def session(monkeypatch):
+    fake = FakeSession()
+    monkeypatch.setattr(explore, "_get_http_session", lambda: fake)
+    explore._item_cache.clear()
+    yield fake
+    explore._item_cache.clear()
+
+
+def _explore(product_id):
+    return json_utils.loads(asyncio.run(explore.explore_product(product_id, None)))
+
+
+def test_repeat_lookup_is_served_from_cache(session):
+    first = _explore("A1")
+    second = _explore("A1")
+    assert session.requests == [["A1"]]
+    assert first == second
+    assert first["products"][0]["sku"] == "A1"
+
+
+def test_only_uncached_skus_are_fetched(session):
+    _explore("A1")
+    result = _explore("B2, A1, C3")
+    assert session.requests == [["A1"], ["B2", "C3"]]
+    assert [p["sku"] for p in result["products"]] == ["B2", "A1", "C3"]
+
+
+def test_expired_items_are_refetched(session, monkeypatch):
+    monkeypatch.setattr(explore, "_ITEM_CACHE_TTL_SECONDS", -1)
+    _explore("A1")
+    _explore("A1")
+    assert session.requests == [["A1"], ["A1"]]
+
+
+def test_cache_evicts_least_recently_used(session):
+    for i in range(explore._ITEM_CACHE_MAXSIZE):
+        explore._cache_put(_item(f"S{i}"))
+    assert explore._cache_get("S0") is not None  # S0 becomes most recently used
+    explore._cache_put(_item("NEW"))
+    assert len(explore._item_cache) == explore._ITEM_CACHE_MAXSIZE
+    assert "S1" not in explore._item_cache
+    assert "S0" in explore._item_cache and "NEW" in explore._item_cache
+
+
+def test_skus_are_split_into_batches_and_merged(session, monkeypatch):
+    monkeypatch.setattr(explore, "_SKU_BATCH_SIZE", 2)
+    monkeypatch.setattr(explore, "_FETCH_CONCURRENCY", 2)
+    items = asyncio.run(explore._fetch_items(["A", "B", "C", "D", "E"]))
+    assert sorted(session.requests) == [["A", "B"], ["C", "D"], ["E"]]
+    assert [item["sku"] for item in items] == ["A", "B", "C", "D", "E"]
+    assert session.max_active == 2
+    assert set(explore._item_cache) == {"A", "B", "C", "D", "E"}
+
+
+def test_single_batch_sends_one_request(session):
+    items = asyncio.run(explore._fetch_items(["A", "B", "C"]))
+    assert session.requests == [["A", "B", "C"]]
+    assert len(items) == 3
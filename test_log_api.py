@@ -0,0 +1,65 @@
+"""
+Test script để kiểm tra log export API
+"""
+
+import csv
+import io
+import sys
+import os
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+from app import log_api
+
+SAMPLE_LOGS = [
+    {"timestamp": 1700000000, "type": "request", "tokens": 12,
+     "data": {"session_id": "s1", "message": "xin chào, \"iphone\""}},
+    {"timestamp": 1700000060, "type": "response", "tokens": 34,
+     "data": {"session_id": "s1", "message": "dòng 1\ndòng 2"}},
+]
+
+
+def _patch_logs(monkeypatch):
+    async def fake_get_logs(**kwargs):
+        return {"logs": SAMPLE_LOGS, "total": len(SAMPLE_LOGS)}
+    monkeypatch.setattr(log_api, "get_logs", fake_get_logs)
+
+
+def _rows(content):
+    return list(csv.reader(io.StringIO(content)))
+
+
+def test_export_csv_keeps_json_envelope(monkeypatch):
+    """format=csv still returns the JSON envelope by default"""
+    _patch_logs(monkeypatch)
+    client = TestClient(log_api.app)
+
+    response = client.get("/api/export/logs", params={"format": "csv"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/json")
+    body = response.json()
+    assert body["format"] == "csv"
+    assert body["total_logs"] == 2
+    assert "exported_at" in body
+    rows = _rows(body["content"])
+    assert rows[0] == ["timestamp", "type", "session_id", "tokens", "data"]
+    assert [row[1] for row in rows[1:]] == ["request", "response"]
+
+
+def test_export_csv_stream(monkeypatch):
+    """stream=true returns the same CSV as a text/csv download"""
+    _patch_logs(monkeypatch)
+    client = TestClient(log_api.app)
+
+    envelope = client.get("/api/export/logs", params={"format": "csv"}).json()
+    response = client.get("/api/export/logs", params={"format": "csv", "stream": "true"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "attachment" in response.headers["content-disposition"]
+    assert _rows(response.text) == _rows(envelope["content"])
+    assert len(_rows(response.text)) == 3
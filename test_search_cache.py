@@ -0,0 +1,102 @@
+"""
+Test script để kiểm tra response cache của search tool
+"""
+
+import asyncio
+import sys
+import os
+
+import pytest
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.tools import search
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    search._response_cache.clear()
+    search._inflight.clear()
+    yield
+    search._response_cache.clear()
+    search._inflight.clear()
+
+
+class FakeFetch:
+    """fetch() stand-in counting calls; fails the first `failures` calls"""
+
+    def __init__(self, failures=0):
+        self.calls = 0
+        self.failures = failures
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.calls <= self.failures:
+            raise RuntimeError("Antsomi down")
+        return {"results": [{"id": 1, "name": "Sữa"}], "total": 1}
+
+
+def test_concurrent_identical_requests_fetch_once():
+    fetch = FakeFetch()
+
+    async def run():
+        return await asyncio.gather(*(search._cached_request(("q",), fetch, 60) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert fetch.calls == 1
+    assert all(r == {"results": [{"id": 1, "name": "Sữa"}], "total": 1} for r in results)
+
+
+def test_each_caller_gets_an_independent_copy():
+    fetch = FakeFetch()
+
+    async def run():
+        first, second = await asyncio.gather(
+            search._cached_request(("q",), fetch, 60), search._cached_request(("q",), fetch, 60)
+        )
+        first["results"].append("mutated")
+        second["results"][0]["name"] = "mutated"
+        return first, second, await search._cached_request(("q",), fetch, 60)
+
+    first, second, cached = asyncio.run(run())
+    assert first is not second
+    assert fetch.calls == 1
+    assert cached == {"results": [{"id": 1, "name": "Sữa"}], "total": 1}
+
+
+def test_expired_entry_is_refetched():
+    fetch = FakeFetch()
+
+    async def run():
+        await search._cached_request(("q",), fetch, -1)  # stored already expired
+        await search._cached_request(("q",), fetch, 60)
+        await search._cached_request(("q",), fetch, 60)
+
+    asyncio.run(run())
+    assert fetch.calls == 2
+
+
+def test_failed_fetch_is_not_cached():
+    fetch = FakeFetch(failures=1)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await search._cached_request(("q",), fetch, 60)
+        return await search._cached_request(("q",), fetch, 60)
+
+    assert asyncio.run(run())["total"] == 1
+    assert fetch.calls == 2
+
+
+def test_distinct_keys_are_cached_separately():
+    fetch = FakeFetch()
+
+    async def run():
+        await search._cached_request(("q", 1), fetch, 60)
+        await search._cached_request(("q", 2), fetch, 60)
+        await search._cached_request(("q", 1), fetch, 60)
+
+    asyncio.run(run())
+    assert fetch.calls == 2